@@ -0,0 +1,63 @@
+import os
+import tempfile
+import click
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+import src.data.db_functions as db_funcs
+from src.data.pipeline import gather_tweets, load_interim_data
+from src.data.raw_archive import RawTweetArchive
+from src.data.replay_api import ReplayTwAPI
+from src.data.storage import write_frame
+from src.data.synthetic_tweets import synthetic_legislators
+from src.instrumentation import RunMetrics
+
+
+@click.command()
+@click.option('--accounts', default=5350, help='Number of replayed accounts (535 is Congress scale)')
+@click.option('--tweets', default=500000, help='Total number of replayed tweets across all accounts')
+@click.option('--workers', default=8, help='Number of timelines to fetch concurrently')
+@click.option('--page-size', default=200, help='Number of tweets per timeline page')
+@click.option('--latency', default=0.0, help='Seconds each simulated API request takes')
+@click.option('--jitter', default=0.0, help='Max seconds of random extra latency per request')
+@click.option('--max-calls', default=None, type=int, help='Timeline requests allowed per rate limit window')
+@click.option('--period', default=900.0, help='Length of the rate limit window in seconds')
+@click.option('--db-url', default=None, help='Database to load into (defaults to a temporary sqlite file)')
+@click.option('--archive/--no-archive', default=True, help='Write fetched tweets to a raw archive')
+@click.option('--trace-memory', is_flag=True, help='Record peak memory of each stage in the run metrics')
+@click.option('--metrics-dir', default=None, help='Directory to write the run metrics to (defaults to the temporary '
+                                                  'directory, so they are only printed)')
+def ingest_load_test(accounts, tweets, workers, page_size, latency, jitter, max_calls, period, db_url, archive,
+                     trace_memory, metrics_dir):
+    """
+    Load test the initial_data_gather -> initial_data_load_db path against a replayed Twitter API
+    """
+    rate_limiter = db_funcs.RateLimiter(max_calls=max_calls, period=period) if max_calls else None
+
+    print('Generating {} tweets for {} accounts...'.format(tweets, accounts))
+    api = ReplayTwAPI.from_synthetic(tweets, n_accounts=accounts, page_size=page_size, rate_limiter=rate_limiter,
+                                     latency=latency, jitter=jitter)
+    legislators, social = synthetic_legislators(accounts)
+
+    metrics = RunMetrics('ingest_load_test', trace_memory=trace_memory)
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(db_url or 'sqlite:///{}'.format(os.path.join(directory, 'tweets.db')))
+
+        write_frame(legislators, os.path.join(directory, 'current_legislators_df.parquet'))
+        write_frame(social, os.path.join(directory, 'legislators_social_df.parquet'))
+
+        fetched = gather_tweets(api, list(social['social.twitter']),
+                                last_date=datetime.utcnow() - timedelta(days=30),
+                                directory=directory,
+                                archive=RawTweetArchive(os.path.join(directory, 'archive')) if archive else None,
+                                max_workers=workers,
+                                metrics=metrics)
+        load_interim_data(engine, directory=directory, metrics=metrics)
+
+        print('{} timeline requests'.format(api.requests['statuses/user_timeline']))
+        print('{:.0f} tweets/s end to end'.format(fetched / metrics.summary()['seconds']))
+        metrics.write(directory=metrics_dir or os.path.join(directory, 'metrics'))
+
+
+if __name__ == '__main__':
+    ingest_load_test()
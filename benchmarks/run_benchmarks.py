@@ -0,0 +1,176 @@
+import io
+import json
+import os
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime
+import click
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LogisticRegression
+from sklearn.naive_bayes import BernoulliNB
+from src.data.db_functions import create_dataframes_from_tweet_json
+from src.data.synthetic_tweets import synthetic_tweets
+from src.features import feature_functions as feat_funcs
+from src.models.ensemble_models import ensemble_base_text_models
+
+# Stages faster than this are too noisy to flag throughput regressions on
+MIN_SECONDS = 0.05
+
+
+def measure(func, *args, memory=True, repeat=3):
+    """
+    Time calls of func and (in a separate, traced run) measure its peak memory allocation
+    :param repeat: number of timed calls, the fastest is reported
+    :return: output of the call, seconds and peak MB allocated (None if memory is False)
+    """
+    with redirect_stdout(io.StringIO()):
+        seconds = None
+
+        for _ in range(repeat):
+            start = time.perf_counter()
+            output = func(*args)
+            elapsed = time.perf_counter() - start
+            seconds = elapsed if seconds is None else min(seconds, elapsed)
+
+        peak_mb = None
+
+        if memory:
+            tracemalloc.start()
+            func(*args)
+            peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+
+    return output, seconds, peak_mb
+
+
+def features_frame(tweets_df, tweets):
+    """
+    Shape tweets dataframe like the tweets query output generate_features expects
+    """
+    df = tweets_df.rename(columns={'id': 'tweet_id', 'user.screen_name': 'twitter_screen_name', 'full_text': 'text'})
+    df['user_followers'] = [tweet['user']['followers_count'] for tweet in tweets]
+    df['created_at'] = pd.to_datetime(df['created_at'])
+    df['party'] = np.where(df['tweet_id'] % 2 == 0, 'Republican', 'Democrat')
+
+    return df
+
+
+def fit_models(base_features, text_features):
+    """
+    Fit small base and text models for timing ensemble_base_text_models
+    """
+    target = base_features['target'].values
+    base_model = LogisticRegression(solver='liblinear').fit(base_features.drop(['tweet_id', 'target'], axis=1).values, target)
+    text_model = BernoulliNB().fit(text_features, target)
+
+    return base_model, text_model
+
+
+def run_size(n_tweets, memory=True, repeat=3, seed=0):
+    """
+    Run every benchmarked stage on n_tweets synthetic tweets
+    :return: dictionary of stage name to results
+    """
+    tweets = synthetic_tweets(n_tweets, seed=seed)
+    results = {}
+
+    def record(stage, func, *args):
+        output, seconds, peak_mb = measure(func, *args, memory=memory, repeat=repeat)
+        results[stage] = {'seconds': seconds, 'tweets_per_second': n_tweets / seconds, 'peak_mb': peak_mb}
+        print('{:>9} tweets {:<32} {:8.3f}s {:12.0f} tweets/s {}'.format(
+            n_tweets, stage, seconds, n_tweets / seconds, '' if peak_mb is None else '{:9.1f} MB'.format(peak_mb)))
+
+        return output
+
+    _, tweets_df = record('create_dataframes_from_tweet_json', create_dataframes_from_tweet_json, tweets,
+                          datetime(2018, 1, 1))
+
+    df = features_frame(tweets_df, tweets)
+    texts = list(df['text'])
+    del tweets
+
+    record('clean_tweets', feat_funcs.clean_tweets, texts)
+    tokens = record('tokenize_tweets', feat_funcs.tokenize_tweets, texts)
+
+    base_features = record('generate_features', lambda frame: feat_funcs.generate_features(frame.copy()), df)
+
+    word_index = feat_funcs.build_word_index(feat_funcs.find_top_used_words(tokens, top_x=1750))
+    text_features = record('generate_common_word_features',
+                           lambda data: feat_funcs.generate_common_word_features(data, word_index=word_index), texts)
+
+    base_model, text_model = fit_models(base_features, text_features)
+    base_matrix = base_features.drop(['tweet_id', 'target'], axis=1).values
+    record('ensemble_base_text_models', ensemble_base_text_models, base_matrix, base_model, text_features, text_model)
+
+    return results
+
+
+def find_regressions(results, baseline, tolerance):
+    """
+    Compare results against baseline results
+    :param tolerance: fraction throughput may drop (or peak memory grow) before it is flagged
+    :return: list of regression messages
+    """
+    regressions = []
+
+    for size, stages in results.items():
+        for stage, result in stages.items():
+            base = baseline.get(size, {}).get(stage)
+
+            if base is None:
+                continue
+
+            if base['seconds'] >= MIN_SECONDS and \
+                    result['tweets_per_second'] < base['tweets_per_second'] * (1 - tolerance):
+                regressions.append('{} at {} tweets: {:.0f} tweets/s vs {:.0f} baseline'.format(
+                    stage, size, result['tweets_per_second'], base['tweets_per_second']))
+
+            if result['peak_mb'] and base.get('peak_mb') and result['peak_mb'] > base['peak_mb'] * (1 + tolerance):
+                regressions.append('{} at {} tweets: {:.1f} MB peak vs {:.1f} MB baseline'.format(
+                    stage, size, result['peak_mb'], base['peak_mb']))
+
+    return regressions
+
+
+@click.command()
+@click.option('--sizes', default='1000,100000,1000000', help='Comma separated numbers of tweets to benchmark')
+@click.option('--memory/--no-memory', default=True, help='Measure peak memory (runs each stage twice)')
+@click.option('--repeat', default=3, help='Number of timed runs per stage (fastest is reported)')
+@click.option('--output', default='benchmarks/results.json', help='File to write results to')
+@click.option('--baseline', default='benchmarks/baseline.json', help='Baseline results to compare against')
+@click.option('--save-baseline', is_flag=True, help='Save these results as the new baseline')
+@click.option('--tolerance', default=0.2, help='Fraction throughput may drop (or memory grow) before flagging')
+def run_benchmarks(sizes, memory, repeat, output, baseline, save_baseline, tolerance):
+    """
+    Benchmark the ingest, text processing, feature and prediction hot paths on synthetic tweets
+    """
+    results = {}
+
+    for size in sizes.split(','):
+        results[size] = run_size(int(size), memory=memory, repeat=repeat)
+
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+    if save_baseline:
+        with open(baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print('Saved baseline to {}'.format(baseline))
+
+    elif os.path.exists(baseline):
+        with open(baseline) as f:
+            regressions = find_regressions(results, json.load(f), tolerance)
+
+        for regression in regressions:
+            print('REGRESSION: {}'.format(regression))
+
+        if regressions:
+            raise SystemExit(1)
+
+        print('No regressions against {}'.format(baseline))
+
+
+if __name__ == '__main__':
+    run_benchmarks()
@@ -1,12 +1,26 @@
-from flask import Flask, request, render_template, url_for
-from predict_party import dem_or_rep
+from flask import Flask, request, render_template, url_for, jsonify
+from predict_party import dem_or_rep, predict_tweets
 from src.features.fetch_tweet_features import generate_tweet_features, fetch_tweet_info
+from src.models.artifact_registry import registry
+from prediction_service import PredictionService
+from src.instrumentation import LatencyHistograms
+from concurrent.futures import TimeoutError
+from requests.exceptions import RequestException
 from tweepy.error import TweepError
 
 
 # create a flask object
 app = Flask(__name__)
 
+# PREDICT_ASYNC runs twitter fetches with a timeout and feature generation on executors
+app.config.setdefault('PREDICT_ASYNC', True)
+app.config.setdefault('TWITTER_FETCH_TIMEOUT', 5)
+
+# Per stage request latency, served as json from /metrics
+latency = LatencyHistograms()
+
+prediction_service = PredictionService(fetch_timeout=app.config['TWITTER_FETCH_TIMEOUT'], latency=latency)
+
 
 # creates an association between the / page and the entry_page function (defaults to GET)
 @app.route('/')
@@ -18,27 +32,80 @@ def entry_page():
 # (includes POST requests which allow users to enter in data via form)
 @app.route('/predict_party/', methods=['GET', 'POST'])
 def render_message():
+    with latency.time('request'):
+        return predict_message()
+
+
+def predict_message():
 
     # User-entered URL
     url = request.form['tweet_url']
 
-    # Error message if not valid Tweet URL
-    messages = ["Twitter API is not available for this user"]
+    # Error message if not valid Tweet URL or Twitter is too slow to respond
+    messages = ["Twitter API is not available for this user",
+                "Twitter API is taking too long to respond, please try again"]
+
+    if app.config['PREDICT_ASYNC']:
+        try:
+            final_message, party, display_info = prediction_service.predict(url)
+        except TweepError:
+            return render_template('index.html', message=messages[0])
+        except (TimeoutError, RequestException):
+            return render_template('index.html', message=messages[1])
+
+        return render_template('index.html', profile_photo=display_info['profile_image'],
+                               twitter_name=display_info['name'],
+                               tweet_text=display_info['tweet_text'],
+                               message=final_message, party_color=party)
+
+    # Text model and vocabulary come from the same loaded version
+    text_artifacts = registry.get('text_artifacts')
 
     # Generate features from tweet
     try:
-        tweet_info = fetch_tweet_info(url)
-        base_features, text_features, display_info = generate_tweet_features(tweet_info)
+        with latency.time('twitter_fetch'):
+            tweet_info = fetch_tweet_info(url)
+
+        with latency.time('feature_generation'):
+            base_features, text_features, display_info = generate_tweet_features(
+                tweet_info, word_index=text_artifacts['word_index'])
     except TweepError:
         return render_template('index.html', message=messages[0])
 
     # show user final message
-    final_message, party = dem_or_rep(base_features, text_features)
+    with latency.time('model_inference'):
+        final_message, party = dem_or_rep(base_features, text_features, text_model=text_artifacts['text_model'])
     return render_template('index.html', profile_photo=display_info['profile_image'],
                            twitter_name=display_info['name'],
                            tweet_text=display_info['tweet_text'],
                            message=final_message, party_color=party)
 
 
+# creates an association between the /predict_party_batch page and the render_batch function
+# (accepts a JSON body {"tweets": [...]} or a form field with one tweet URL or ID per line)
+@app.route('/predict_party_batch/', methods=['POST'])
+def render_batch():
+
+    payload = request.get_json(silent=True)
+
+    if payload is not None:
+        tweets = payload.get('tweets', [])
+    else:
+        tweets = request.form.get('tweet_urls', '').split()
+
+    try:
+        predictions, errors = predict_tweets(tweets)
+    except TweepError:
+        return jsonify(predictions=[], errors=[{'input': None, 'error': 'Twitter API is not available'}]), 503
+
+    return jsonify(predictions=predictions, errors=errors)
+
+
+# creates an association between the /metrics page and per stage prediction latency histograms
+@app.route('/metrics')
+def render_metrics():
+    return jsonify(latency.snapshot())
+
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
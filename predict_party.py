@@ -1,23 +1,31 @@
-import pickle
 from src.models.ensemble_models import ensemble_base_text_models
+from src.models.artifact_registry import registry
+from src.features.fetch_tweet_features import parse_tweet_ids, fetch_tweets_info, generate_batch_tweet_features
+from src.features.feature_functions import load_word_index
 
-# read in the models
-with open("models/final_base_clf.pkl", "rb") as mdl:
-    base_model = pickle.load(mdl)
-
-with open("models/final_text_clf.pkl", "rb") as mdl:
-    text_model = pickle.load(mdl)
+# register the models (loaded on first use, reloaded when their files change) - the text model is trained on
+# features of its vocabulary, so both are registered as the text_artifacts group and reloaded together
+registry.register('base_model', 'models/final_base_clf.pkl')
+registry.register_group('text_artifacts', {'text_model': 'models/final_text_clf.pkl',
+                                           'word_index': 'data/processed/all_word_features.pkl'},
+                        loaders={'word_index': load_word_index})
 
 
 # create a function to take in user-entered amounts and apply the model
 def dem_or_rep(base_features, text_features,
-               base_model=base_model, text_model=text_model):
+               base_model=None, text_model=None):
+
+    if base_model is None:
+        base_model = registry.get('base_model')
+    if text_model is None:
+        text_model = registry.get('text_artifacts')['text_model']
 
     # make a prediction
     predict_prob, prediction = ensemble_base_text_models(base_features=base_features,
                                                          text_features=text_features,
                                                          base_model=base_model,
                                                          text_model=text_model)
+    predict_prob, prediction = predict_prob[0], int(prediction[0])
 
     # return a message
     message_array = ["{}% Democrat!".format(round((1-predict_prob)*100, 2)),
@@ -28,3 +36,58 @@ def dem_or_rep(base_features, text_features,
 
     return message_array[prediction], party_color[prediction]
 
+
+def predict_tweets(urls_or_ids, base_model=None, text_model=None):
+    """
+    Score a batch of tweets given their URLs or IDs. Tweets are fetched in bulk and each model
+    makes a single prediction over the whole batch
+    :param urls_or_ids: List of tweet URLs and/or tweet IDs
+    :return: list of predictions (one per scored tweet, in input order) and list of errors for inputs
+    that could not be parsed or fetched
+    """
+    tweet_ids = parse_tweet_ids(urls_or_ids)
+
+    errors = [{'input': item, 'error': 'Invalid tweet URL or ID'}
+              for item, tweet_id in zip(urls_or_ids, tweet_ids) if tweet_id is None]
+
+    tweets = fetch_tweets_info([tweet_id for tweet_id in tweet_ids if tweet_id is not None])
+
+    # Keep input order and drop tweets the API could not return
+    found = [(item, tweet_id) for item, tweet_id in zip(urls_or_ids, tweet_ids) if tweet_id in tweets]
+    errors += [{'input': item, 'error': 'Twitter API is not available for this tweet'}
+               for item, tweet_id in zip(urls_or_ids, tweet_ids)
+               if tweet_id is not None and tweet_id not in tweets]
+
+    if not found:
+        return [], errors
+
+    # Text model and vocabulary come from the same loaded version
+    text_artifacts = registry.get('text_artifacts')
+
+    if base_model is None:
+        base_model = registry.get('base_model')
+    if text_model is None:
+        text_model = text_artifacts['text_model']
+
+    base_features, text_features, display_info = generate_batch_tweet_features([tweets[tweet_id]
+                                                                                for _, tweet_id in found],
+                                                                               word_index=text_artifacts['word_index'])
+
+    predict_prob, prediction = ensemble_base_text_models(base_features=base_features,
+                                                         text_features=text_features,
+                                                         base_model=base_model,
+                                                         text_model=text_model)
+
+    parties = ['Democrat', 'Republican']
+    predictions = []
+
+    for (item, tweet_id), prob, pred, display in zip(found, predict_prob, prediction, display_info):
+        predictions.append({'input': item,
+                            'tweet_id': tweet_id,
+                            'twitter_name': display['name'],
+                            'tweet_text': display['tweet_text'],
+                            'republican_prob': float(prob),
+                            'democrat_prob': float(1 - prob),
+                            'party': parties[int(pred)]})
+
+    return predictions, errors
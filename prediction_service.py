@@ -0,0 +1,73 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from predict_party import dem_or_rep
+from src.models.artifact_registry import registry
+from src.features.fetch_tweet_features import extract_twitter_id, fetch_tweet_info, generate_tweet_features
+from src.instrumentation import LatencyHistograms
+
+
+class PredictionService:
+
+    def __init__(self, fetch_timeout=5, fetch_workers=16, feature_workers=4, feature_executor=None, latency=None):
+        """
+        Initialize prediction service. Twitter fetches run on their own thread pool with a timeout so a slow
+        Twitter response can't hold a web worker indefinitely, and concurrent requests for the same tweet share
+        one in-flight fetch. Feature generation runs on a separate bounded executor
+        :param fetch_timeout: seconds to wait for the Twitter API before giving up
+        :param fetch_workers: max number of concurrent Twitter fetches
+        :param feature_workers: max number of tweets having features generated at once
+        :param feature_executor: executor for feature generation (eg. a ProcessPoolExecutor), defaults to a
+        thread pool with feature_workers threads
+        :param latency: LatencyHistograms to record twitter fetch, feature generation and inference latency in
+        """
+        self.fetch_timeout = fetch_timeout
+        self.fetch_executor = ThreadPoolExecutor(max_workers=fetch_workers)
+        self.feature_executor = feature_executor or ThreadPoolExecutor(max_workers=feature_workers)
+        self.in_flight = {}
+        self.lock = threading.RLock()
+        self.latency = latency or LatencyHistograms()
+
+    def fetch(self, url):
+        """
+        Start fetching a tweet, or join the fetch already in flight for the same tweet
+        :return: future resolving to json tweet
+        """
+        tweet_id = extract_twitter_id(url)
+
+        with self.lock:
+            future = self.in_flight.get(tweet_id)
+
+            if future is None:
+                future = self.fetch_executor.submit(fetch_tweet_info, url, timeout=self.fetch_timeout)
+                self.in_flight[tweet_id] = future
+                future.add_done_callback(lambda done: self.forget(tweet_id))
+
+        return future
+
+    def forget(self, tweet_id):
+        """
+        Remove finished fetch so the next request for the tweet fetches fresh data
+        """
+        with self.lock:
+            self.in_flight.pop(tweet_id, None)
+
+    def predict(self, url):
+        """
+        Fetch tweet, generate features and predict party
+        Raises concurrent.futures.TimeoutError if the Twitter API doesn't respond within fetch_timeout
+        :return: final message, party color and dictionary with tweet display info
+        """
+        with self.latency.time('twitter_fetch'):
+            tweet_info = self.fetch(url).result(timeout=self.fetch_timeout)
+
+        # Text model and vocabulary come from the same loaded version
+        text_artifacts = registry.get('text_artifacts')
+
+        with self.latency.time('feature_generation'):
+            base_features, text_features, display_info = self.feature_executor.submit(
+                generate_tweet_features, tweet_info, word_index=text_artifacts['word_index']).result()
+
+        with self.latency.time('model_inference'):
+            final_message, party = dem_or_rep(base_features, text_features, text_model=text_artifacts['text_model'])
+
+        return final_message, party, display_info
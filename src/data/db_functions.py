@@ -1,11 +1,23 @@
 import tweepy
+import requests
 import pandas as pd
 from datetime import datetime
 import time
+import io
+import threading
+from uuid import uuid4
+from collections import deque
+from itertools import takewhile
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, Table, MetaData, inspect, text
+from sqlalchemy.types import Date
 from configparser import ConfigParser
 import pytz
+from src.data.sql_queries import last_updated_sql, completed_runs_table_sql, record_completed_run_sql, \
+    last_completed_run_sql, timeline_watermarks_sql, collected_profiles_sql, timeline_watermarks_table_sql, \
+    upsert_timeline_watermark_sql, dedupe_tweets_postgres_sql, dedupe_tweets_sql, \
+    tweets_unique_index_sql, upsert_sql, add_column_sql, migration_sql, migration_columns
 
 
 # Connect to Postgres DB
@@ -31,6 +43,49 @@ def db_create_engine(config_file, conn_name):
     return engine
 
 
+API_URL = 'https://api.twitter.com/1.1/'
+
+# Twitter's timestamp format for created_at
+TWITTER_TIME_FORMAT = '%a %b %d %H:%M:%S +0000 %Y'
+
+
+def parse_created_at(created_at):
+    """Parse created_at string from tweet json into a (UTC) datetime"""
+    return datetime.strptime(created_at, TWITTER_TIME_FORMAT)
+
+
+# Shared request budget so concurrent workers don't all trip the rate limit at once
+class RateLimiter:
+
+    def __init__(self, max_calls=900, period=15 * 60):
+        """
+        Initialize rate limiter allowing max_calls requests in any rolling window of period seconds
+        (900 per 15 minutes is the user auth limit for statuses/user_timeline)
+        """
+        self.max_calls = max_calls
+        self.period = period
+        self.calls = deque()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Block until a request is available in the budget, then use it
+        """
+        with self.lock:
+            while True:
+                now = time.time()
+
+                while self.calls and now - self.calls[0] >= self.period:
+                    self.calls.popleft()
+
+                if len(self.calls) < self.max_calls:
+                    self.calls.append(now)
+                    return
+
+                # Other workers wait on the lock while the budget refills
+                time.sleep(self.period - (now - self.calls[0]))
+
+
 # Create class to access Twitter API
 class TwAPI:
 
@@ -38,13 +93,16 @@ class TwAPI:
                  access_token,
                  access_token_secret,
                  consumer_key,
-                 consumer_secret):
+                 consumer_secret,
+                 rate_limiter=None):
         """
         Initialize api client
         """
         self.auth = tweepy.OAuthHandler(consumer_key, consumer_secret)
         self.auth.set_access_token(access_token, access_token_secret)
         self.api = tweepy.API(self.auth, wait_on_rate_limit=True, wait_on_rate_limit_notify=True)
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.local = threading.local()
 
     @staticmethod
     def limit_handled(cursor):
@@ -54,49 +112,241 @@ class TwAPI:
             except tweepy.RateLimitError:
                 time.sleep(15 * 60)
 
-    def fetch_user_timeline(self, screen_name, last_date, include_rts=False):
+    def timeline_pages(self, screen_name, include_rts=False, since_id=None):
+        """
+        Generator of timeline pages (newest first) for a twitter screen name.
+        Each page request is drawn from the shared rate limit budget
+        :param since_id: only return tweets newer than this tweet id
+        :return: yields lists of json tweets
+        """
+        params = {'screen_name': screen_name, 'include_rts': include_rts, 'tweet_mode': 'extended', 'count': 200}
+
+        if since_id is not None:
+            params['since_id'] = since_id
+
+        cursor = tweepy.Cursor(self.api.user_timeline, **params)
+        pages = cursor.pages()
+
+        while True:
+            self.rate_limiter.acquire()
+
+            try:
+                page = pages.next()
+            except StopIteration:
+                return
+            except tweepy.RateLimitError:
+                time.sleep(15 * 60)
+                continue
+
+            yield [tweet._json for tweet in page]
+
+    def iter_user_timeline(self, screen_name, last_date, include_rts=False, since_id=None):
+        """
+        Generator of json tweets for a twitter screen name, one page at a time, stopping at the first
+        tweet created on or before last_date (pass last_date=None to rely on since_id alone)
+        :return: yields lists of json tweets
+        """
+        for page in self.timeline_pages(screen_name=screen_name, include_rts=include_rts, since_id=since_id):
+            new_tweets = list(takewhile(lambda tweet: last_date is None or
+                                        parse_created_at(tweet['created_at']) > last_date, page))
+
+            if new_tweets:
+                yield new_tweets
+
+            if len(new_tweets) < len(page):
+                return
+
+    def fetch_user_timeline(self, screen_name, last_date, include_rts=False, since_id=None):
         """"
         Takes in a twitter screen name and returns all tweet data in json format for tweets created in the past X days
         Parameter 'include_rts' to exclude or include retweets
+        Parameter 'since_id' to only page through tweets newer than the account's last collected tweet
+        (pass last_date=None to rely on since_id alone)
         Returns a list of json tweets
         """
         tweet_list = []
 
-        cursor = tweepy.Cursor(self.api.user_timeline, screen_name=screen_name,
-                               include_rts=include_rts, tweet_mode="extended", count=200)
-        tweets = self.limit_handled(cursor.items())
+        for page in self.iter_user_timeline(screen_name=screen_name, last_date=last_date,
+                                            include_rts=include_rts, since_id=since_id):
+            tweet_list.extend(page)
+
+        return tweet_list
+
+    def _fetch_timeline_or_skip(self, screen_name, last_date, include_rts=False, since_id=None):
+        """
+        Fetch user timeline, returning an empty list for accounts that no longer exist (404)
+        """
+        try:
+            return self.fetch_user_timeline(screen_name=screen_name, last_date=last_date,
+                                            include_rts=include_rts, since_id=since_id)
 
-        for tweet in tweets:
-            if tweet.created_at > last_date:
-                tweet_list.append(tweet._json)
+        except tweepy.error.TweepError as e:
+            if e.response.status_code == 404:
+                return []
             else:
-                return tweet_list
+                raise e
+
+    @staticmethod
+    def _timeline_args(screen_name, last_date, include_rts, since_ids):
+        """
+        Arguments for one account - accounts with a since_id watermark don't need the date cutoff
+        """
+        since_id = since_ids.get(screen_name.lower())
+
+        return screen_name, (last_date if since_id is None else None), include_rts, since_id
 
-    def fetch_all_timelines(self, screen_names, last_date, include_rts=False):
+    def iter_all_timelines(self, screen_names, last_date, include_rts=False, max_workers=1, since_ids=None):
+        """
+        Generator of tweets for a list of twitter screen names, in screen name order.
+        Fetching one at a time yields a page at a time, concurrent fetching yields an account at a time
+        and keeps at most two accounts per worker in flight
+        :param screen_names: list of twitter screen names
+        :param last_date: only return tweets created after this date
+        :param include_rts: boolean indicator to include retweets
+        :param max_workers: number of timelines to fetch concurrently (1 fetches one at a time)
+        :param since_ids: dictionary of lowercase screen name to newest collected tweet id - accounts with a
+        watermark only fetch newer tweets, the rest fall back to last_date
+        :return: yields lists of json tweets
+        """
+        since_ids = since_ids or {}
+
+        if max_workers == 1:
+            for name in screen_names:
+                try:
+                    for page in self.iter_user_timeline(*self._timeline_args(name, last_date,
+                                                                             include_rts, since_ids)):
+                        yield page
+
+                except tweepy.error.TweepError as e:
+                    if e.response.status_code == 404:
+                        pass
+                    else:
+                        raise e
+            return
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = deque()
+
+            try:
+                for name in screen_names:
+                    pending.append(executor.submit(self._fetch_timeline_or_skip,
+                                                   *self._timeline_args(name, last_date, include_rts, since_ids)))
+
+                    if len(pending) >= 2 * max_workers:
+                        yield pending.popleft().result()
+
+                while pending:
+                    yield pending.popleft().result()
+
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def fetch_all_timelines(self, screen_names, last_date, include_rts=False, max_workers=1, since_ids=None):
         """
         Take in list of twitter screen names and fetch all tweets occurring in the past X days
         :param screen_names: list of twitter screen names
         :param days_ago: number of days to pull tweets from
         :param include_rts: boolean indicator to include retweets
+        :param max_workers: number of timelines to fetch concurrently (1 fetches one at a time)
+        :param since_ids: dictionary of lowercase screen name to newest collected tweet id - accounts with a
+        watermark only fetch newer tweets, the rest fall back to last_date
         :return: list of tweets for accounts in list occurring in the past X days
         """
         timeline_list = []
 
-        for index, name in enumerate(screen_names):
+        for timeline in self.iter_all_timelines(screen_names=screen_names, last_date=last_date,
+                                                include_rts=include_rts, max_workers=max_workers,
+                                                since_ids=since_ids):
+            timeline_list.extend(timeline)
 
-            try:
-                timeline = self.fetch_user_timeline(screen_name=name, last_date=last_date,
-                                                    include_rts=include_rts)
-                if timeline:
-                    timeline_list.extend(timeline)
+        return timeline_list
+
+    def session(self):
+        """
+        Keep-alive http session for this thread, signed with the client's OAuth credentials.
+        Sessions are kept per thread so concurrent requests never share a connection
+        """
+        session = getattr(self.local, 'session', None)
 
-            except tweepy.error.TweepError as e:
-                if e.response.status_code == 404:
-                    pass
-                else:
-                    raise e
+        if session is None:
+            session = requests.Session()
+            session.auth = self.auth.apply_auth()
+            self.local.session = session
 
-        return timeline_list
+        return session
+
+    def get_json(self, endpoint, params, timeout=None):
+        """
+        GET a Twitter API endpoint over the thread's keep-alive session
+        :param endpoint: API path, eg. 'statuses/show.json'
+        :param params: dictionary of query parameters
+        :param timeout: seconds to wait for the API to respond (None waits indefinitely)
+        :return: decoded json response
+        """
+        # Network failures are raised as TweepError, like the tweepy calls this replaces
+        try:
+            response = self.session().get(API_URL + endpoint, params=params, timeout=timeout)
+        except requests.RequestException as e:
+            raise tweepy.TweepError(str(e))
+
+        if response.status_code == 429:
+            raise tweepy.RateLimitError('Twitter API rate limit exceeded', response=response)
+        if response.status_code != 200:
+            raise tweepy.TweepError('Twitter error response: status code = {}'.format(response.status_code),
+                                    response=response)
+
+        return response.json()
+
+    def get_status(self, tweet_id, timeout=None):
+        """
+        Fetch a single tweet by id
+        :return: json tweet
+        """
+        return self.get_json('statuses/show.json', params={'id': tweet_id, 'tweet_mode': 'extended'},
+                             timeout=timeout)
+
+    def lookup_statuses(self, tweet_ids, batch_size=100, timeout=None):
+        """
+        Fetch tweets in bulk by id (the API accepts up to 100 ids per request)
+        :param tweet_ids: list of tweet ids
+        :param batch_size: number of ids to send per request
+        :param timeout: seconds to wait for each request
+        :return: list of json tweets - ids that are deleted or protected are omitted
+        """
+        tweet_list = []
+
+        for start in range(0, len(tweet_ids), batch_size):
+            tweet_list.extend(self.get_json('statuses/lookup.json',
+                                            params={'id': ','.join(tweet_ids[start:start + batch_size]),
+                                                    'tweet_mode': 'extended'},
+                                            timeout=timeout))
+
+        return tweet_list
+
+
+# One long-lived client per config file, shared by the web app and the CLI commands
+_twitter_clients = {}
+_twitter_clients_lock = threading.Lock()
+
+
+def get_twitter_client(config_file='config.ini'):
+    """
+    Return the process-wide Twitter API client for the TwitterKeys section of config file,
+    creating it on first use
+    """
+    with _twitter_clients_lock:
+        if config_file not in _twitter_clients:
+            config = ConfigParser()
+            config.read(config_file)
+
+            _twitter_clients[config_file] = TwAPI(consumer_key=config.get('TwitterKeys', 'consumer_key'),
+                                                  consumer_secret=config.get('TwitterKeys', 'consumer_secret'),
+                                                  access_token=config.get('TwitterKeys', 'access_token'),
+                                                  access_token_secret=config.get('TwitterKeys',
+                                                                                 'access_token_secret'))
+
+        return _twitter_clients[config_file]
 
 
 # Parse out hashtag text into list
@@ -133,11 +383,12 @@ def list_media(list_dicts):
     return media_types
 
 
-def create_dataframes_from_tweet_json(tweet_json):
+def create_dataframes_from_tweet_json(tweet_json, time_collected=None):
     """
     Function to transform tweet data in json format into tabular format and subset relevant
     information for tweets dataframe and users dataframe
     :param tweet_json: Json tweet data - a list of dictionaries containing tweet data
+    :param time_collected: Collection timestamp to record (defaults to now)
     :return: A dataframe for all relevant tweet data and a dataframe with updated user profiles
     """
 
@@ -159,7 +410,7 @@ def create_dataframes_from_tweet_json(tweet_json):
     tweets_df['hashtags'] = [list_hashtags(tag) for tag in tweets_df['entities.hashtags']]
     tweets_df['media_type'] = [list_media(tag) for tag in tweets_df['entities.media']]
     tweets_df['user_mentions'] = [list_mentions(tag) for tag in tweets_df['entities.user_mentions']]
-    tweets_df['time_collected'] = datetime.utcnow()
+    tweets_df['time_collected'] = time_collected or datetime.utcnow()
 
     # Cleanup
     tweets_df.drop(['display_text_range', 'entities.hashtags',
@@ -176,6 +427,162 @@ def create_dataframes_from_tweet_json(tweet_json):
     return users_df, tweets_df
 
 
+def pg_array_literal(values):
+    """
+    Format a list the way Postgres renders an array cast to text (eg. '{MAGA,"tax reform"}'),
+    which is how list columns have always been stored in the text columns of the db
+    """
+    elements = []
+
+    for value in values:
+        value = str(value)
+
+        if value == '' or value.upper() == 'NULL' or any(c in value for c in '{}",\\ \t\n'):
+            value = '"{}"'.format(value.replace('\\', '\\\\').replace('"', '\\"'))
+
+        elements.append(value)
+
+    return '{' + ','.join(elements) + '}'
+
+
+def bulk_load_df(df, table_name, engine, if_exists='append', chunksize=50000, dtype=None):
+    """
+    Bulk load dataframe into sql db. Postgres tables are loaded with COPY FROM STDIN using an
+    in-memory csv buffer, other backends (eg. sqlite) fall back to batched executemany inserts
+    :param df: Dataframe with columns matching the table
+    :param table_name: Name of table to load
+    :param engine: sqlAlchemy engine connected to database
+    :param if_exists: 'append' to add to existing table or 'replace' to recreate it (as in DataFrame.to_sql)
+    :param chunksize: Number of rows sent per COPY or executemany batch
+    :param dtype: Dictionary of column name to sqlAlchemy type for columns whose type can't be inferred
+    """
+    data = df.copy(deep=False)
+
+    for col in data.columns:
+        if data[col].dtype == object:
+            # list columns read back from parquet files are numpy arrays
+            data[col] = [pg_array_literal(x) if isinstance(x, (list, np.ndarray)) else x for x in data[col]]
+
+    # Create (or replace) table schema from the dataframe dtypes without inserting any rows
+    data.head(0).to_sql(name=table_name, con=engine, if_exists=if_exists, index=False, dtype=dtype)
+
+    if engine.dialect.name == 'postgresql':
+        columns = ', '.join('"{}"'.format(col) for col in data.columns)
+        copy_sql = 'COPY "{}" ({}) FROM STDIN WITH (FORMAT csv, NULL \'\\N\')'.format(table_name, columns)
+
+        connection = engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+
+            for start in range(0, len(data), chunksize):
+                buffer = io.StringIO()
+                data.iloc[start:start + chunksize].to_csv(buffer, index=False, header=False, na_rep='\\N')
+                buffer.seek(0)
+                cursor.copy_expert(copy_sql, buffer)
+
+            connection.commit()
+        finally:
+            connection.close()
+
+    else:
+        table = Table(table_name, MetaData(), autoload=True, autoload_with=engine)
+
+        with engine.begin() as connection:
+            for start in range(0, len(data), chunksize):
+                chunk = data.iloc[start:start + chunksize].astype(object)
+                records = chunk.where(pd.notnull(chunk), None).to_dict('records')
+                connection.execute(table.insert(), records)
+
+
+def upsert_df(df, table_name, engine, key, update_columns, dtype=None):
+    """
+    Insert new rows and update existing ones in bulk. Rows are bulk loaded into a staging table (named per call,
+    so concurrent upserts don't share one) and merged into the table with INSERT ... ON CONFLICT, which needs a
+    unique index on the key column
+    :param df: Dataframe with columns matching the table
+    :param table_name: Name of table to upsert into
+    :param engine: sqlAlchemy engine connected to database
+    :param key: Name of the unique column to match rows on
+    :param update_columns: Columns to overwrite when a row with the same key already exists
+    :param dtype: Dictionary of column name to sqlAlchemy type for columns whose type can't be inferred
+    """
+    staging_name = '{}_staging_{}'.format(table_name, uuid4().hex)
+    data = df.drop_duplicates(subset=[key], keep='last')
+
+    merge_sql = upsert_sql.format(table=table_name, staging=staging_name, key=key,
+                                  columns=', '.join(data.columns),
+                                  updates=', '.join('{0} = EXCLUDED.{0}'.format(col) for col in update_columns))
+
+    try:
+        bulk_load_df(data, table_name=staging_name, engine=engine, if_exists='fail', dtype=dtype)
+
+        with engine.begin() as connection:
+            connection.execute(merge_sql)
+    finally:
+        with engine.begin() as connection:
+            connection.execute('DROP TABLE IF EXISTS {}'.format(staging_name))
+
+
+def ensure_unique_tweet_ids(engine):
+    """
+    Remove duplicate tweets (keeping the most recently collected row, the last inserted one on ties) and add
+    a unique index on tweet_id.
+    Does nothing if the unique index already exists
+    """
+    if any(index['name'] == 'ix_tweets_tweet_id_unique' for index in inspect(engine).get_indexes('tweets')):
+        return
+
+    print('Removing duplicate tweets and adding unique index on tweet_id')
+    with engine.begin() as connection:
+        if engine.dialect.name == 'postgresql':
+            connection.execute(dedupe_tweets_postgres_sql)
+        else:
+            connection.execute(dedupe_tweets_sql)
+
+        connection.execute(tweets_unique_index_sql)
+
+
+def missing_columns(engine):
+    """
+    Find columns added by migrate_schema that an existing database doesn't have yet (tables that don't exist
+    yet are skipped, they are created with every column)
+    :return: list of 'table.column' names
+    """
+    inspector = inspect(engine)
+    tables = inspector.get_table_names()
+    missing = []
+
+    for table, column, _ in migration_columns:
+        if table in tables and column not in [existing['name'] for existing in inspector.get_columns(table)]:
+            missing.append('{}.{}'.format(table, column))
+
+    return missing
+
+
+def migrate_schema(engine):
+    """
+    Bring an existing database up to the current schema: adds collection date columns and the tweets load time
+    (backfilled from time_collected), lowercases screen name join keys, adds indexes used by tweets_sql and
+    past_week_tweets_sql and makes tweet_id (and timeline watermark screen names) unique.
+    Safe to run more than once
+    """
+    missing = missing_columns(engine)
+
+    for table, column, column_type in migration_columns:
+        if '{}.{}'.format(table, column) in missing:
+            print('Adding {} column to {}'.format(column, table))
+            with engine.begin() as connection:
+                connection.execute(add_column_sql.format(table=table, column=column, column_type=column_type))
+
+    with engine.begin() as connection:
+        for statement in migration_sql:
+            connection.execute(statement)
+
+    ensure_unique_tweet_ids(engine)
+    ensure_timeline_watermarks_table(engine)
+    print('Schema migration complete')
+
+
 def load_legislator_table(df, engine, if_exists='append'):
     """Utility function to transform dataframe to conform to database scheme and load in sql db"""
 
@@ -189,7 +596,7 @@ def load_legislator_table(df, engine, if_exists='append'):
                                 'party': 'party'}, inplace=True)
 
     print('Populating Legislators Table')
-    df.to_sql(name='legislators', con=engine, if_exists=if_exists, index=False)
+    bulk_load_df(df, table_name='legislators', engine=engine, if_exists=if_exists)
 
 
 def load_user_profile_table(df, engine, if_exists='append'):
@@ -200,11 +607,13 @@ def load_user_profile_table(df, engine, if_exists='append'):
     df['id'] = [str(x) for x in df['id']]
     df['created_at'] = pd.to_datetime(df['created_at'])
     df['screen_name'] = [x.lower() for x in df['screen_name']]
+    df['collected_date'] = pd.to_datetime(df['time_collected']).dt.date
 
     df.rename(columns={'id': 'twitter_user_id'}, inplace=True)
 
     print('Populating User Profile Log Table')
-    df.to_sql(name='user_profile_log', con=engine, if_exists=if_exists, index=False)
+    bulk_load_df(df, table_name='user_profile_log', engine=engine, if_exists=if_exists,
+                 dtype={'collected_date': Date()})
 
 
 def load_social_table(df, engine, if_exists='append'):
@@ -220,20 +629,120 @@ def load_social_table(df, engine, if_exists='append'):
                        'social.twitter_id': 'twitter_id'}, inplace=True)
 
     print('Populating Social Table')
-    df.to_sql(name='social', con=engine, if_exists=if_exists, index=False)
+    bulk_load_df(df, table_name='social', engine=engine, if_exists=if_exists)
 
 
 def load_tweets_table(df, engine, if_exists='append'):
-    """Utility function to transform dataframe to conform to database scheme and load in sql db"""
+    """
+    Utility function to transform dataframe to conform to database scheme and load in sql db.
+    Pass if_exists='upsert' to insert new tweets and update engagement counts of tweets already in the db.
+    loaded_at records when a tweet was first loaded (an upsert leaves it alone), which incremental exports use as
+    their watermark
+    """
 
     df['id'] = [str(x) for x in df['id']]
     df['created_at'] = pd.to_datetime(df['created_at'])
     df['user.screen_name'] = [x.lower() for x in df['user.screen_name']]
+    df['collected_date'] = pd.to_datetime(df['time_collected']).dt.date
+    df['loaded_at'] = datetime.utcnow()
 
     df.rename(columns={'id': 'tweet_id',
                        'user.screen_name': 'twitter_screen_name',
                        'full_text': 'text'}, inplace=True)
 
-    print('Populating Tweets Table (this may take several minutes... like 30)')
-    df.to_sql(name='tweets', con=engine, if_exists=if_exists, index=False)
+    if if_exists == 'upsert':
+        print('Upserting Tweets Table')
+        ensure_unique_tweet_ids(engine)
+        upsert_df(df, table_name='tweets', engine=engine, key='tweet_id',
+                  update_columns=['favorite_count', 'retweet_count', 'time_collected', 'collected_date'],
+                  dtype={'collected_date': Date()})
+        return
+
+    print('Populating Tweets Table')
+    bulk_load_df(df, table_name='tweets', engine=engine, if_exists=if_exists,
+                 dtype={'collected_date': Date()})
+
+
+def fetch_timeline_watermarks(engine):
+    """
+    Utility function to read the newest collected tweet id per account
+    :return: dictionary of lowercase screen name to since_id (empty if no watermarks have been stored yet)
+    """
+    if not engine.has_table('timeline_watermarks'):
+        return {}
+
+    watermarks = pd.read_sql_query(sql=timeline_watermarks_sql, con=engine)
+
+    return dict(zip(watermarks['twitter_screen_name'], watermarks['since_id']))
+
+
+def record_completed_run(engine, started_at):
+    """
+    Utility function to record that a fetch run which started at started_at has been completely loaded
+    """
+    with engine.begin() as connection:
+        connection.execute(completed_runs_table_sql)
+        connection.execute(text(record_completed_run_sql), {'started_at': started_at, 'finished_at': datetime.utcnow()})
+
+
+def fetch_last_completed_run(engine):
+    """
+    Utility function to find the date to fetch tweets from for accounts without a since_id watermark: the start
+    of the last fetch run that was completely loaded. Databases with no completed runs recorded yet fall back
+    to the latest collection time
+    """
+    if engine.has_table('completed_runs'):
+        started_at = pd.read_sql_query(sql=last_completed_run_sql, con=engine).iloc[0, 0]
+
+        if started_at is not None and not pd.isnull(started_at):
+            return pd.Timestamp(started_at).to_pydatetime()
+
+    return pd.read_sql_query(sql=last_updated_sql, con=engine).iloc[0, 0]
+
+
+def fetch_collected_profiles(engine, time_collected):
+    """
+    Utility function to find accounts whose profile was already logged at a collection time
+    :return: set of lowercase screen names (empty if the user_profile_log table doesn't exist yet)
+    """
+    if not engine.has_table('user_profile_log'):
+        return set()
+
+    profiles = pd.read_sql_query(sql=text(collected_profiles_sql), con=engine,
+                                 params={'time_collected': time_collected})
+
+    return set(profiles['screen_name'].str.lower())
+
+
+def ensure_timeline_watermarks_table(engine):
+    """
+    Create the timeline_watermarks table if it doesn't exist, and make sure screen names are unique so
+    watermarks can be upserted. Safe to run more than once
+    """
+    with engine.begin() as connection:
+        for statement in timeline_watermarks_table_sql:
+            connection.execute(statement)
+
+
+def update_timeline_watermarks(df, engine):
+    """
+    Utility function to record the newest tweet id per account from a loaded tweets dataframe
+    (run after load_tweets_table, which renames the columns to match the tweets table).
+    Only accounts whose watermark moves forward are upserted, in one transaction
+    """
+    ensure_timeline_watermarks_table(engine)
+    watermarks = fetch_timeline_watermarks(engine)
+    updated_at = datetime.utcnow()
+    changed = []
+
+    for screen_name, tweet_ids in df.groupby('twitter_screen_name')['tweet_id']:
+        newest = max(tweet_ids, key=int)
+
+        if screen_name not in watermarks or int(newest) > int(watermarks[screen_name]):
+            changed.append({'twitter_screen_name': screen_name, 'since_id': str(newest), 'updated_at': updated_at})
+
+    print('Updating timeline watermarks for {} accounts'.format(len(changed)))
 
+    if changed:
+        with engine.begin() as connection:
+            connection.execute(text(upsert_timeline_watermark_sql), changed)
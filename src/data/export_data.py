@@ -2,8 +2,16 @@ import gspread
 from gspread.exceptions import RequestError
 from oauth2client.service_account import ServiceAccountCredentials
 import pandas as pd
-from src.data.db_functions import db_create_engine
-from src.data.sql_queries import legislators_sql, tweets_sql
+from dateutil.parser import parse
+import os
+import gzip
+import json
+import shutil
+from itertools import chain
+from sqlalchemy import text
+from src.data.db_functions import db_create_engine, missing_columns
+from src.data.sql_queries import legislators_sql, tweets_sql, tweets_loaded_until_sql, tweets_loaded_between_sql, \
+    last_loaded_sql
 
 
 def create_gs_client(gs_credentials_json):
@@ -20,39 +28,193 @@ def next_available_row(worksheet):
     return str(len(str_list)+1)
 
 
-def add_new_rows(df, sheet, first_blank_row, gs_client):
-    next_row = first_blank_row
+def column_letter(column):
+    """
+    Spreadsheet column letter(s) for a 1-based column number (1 -> 'A', 11 -> 'K', 27 -> 'AA')
+    """
+    letters = ''
+
+    while column > 0:
+        column, remainder = divmod(column - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+
+    return letters
+
 
-    for index, row in df.iterrows():
-
-        range_build = 'A' + str(next_row) + ':K' + str(next_row)
-        cell_list = sheet.range(range_build)
-
-        try:
-            for i in range(0, len(row)):
-                cell_list[i].value = row[i]
-
-            sheet.update_cells(cell_list)
-            next_row += 1
-
-        except RequestError:
-
-            # Refresh authorization
-            gs_client.login()
-
-            for i in range(0, len(row)):
-                cell_list[i].value = row[i]
-
-            sheet.update_cells(cell_list)
-            next_row += 1
-
-
-def refresh_tableau_csv_files():
+def find_new_rows(df, worksheet, date_column='E'):
+    """
+    Find rows not yet in the worksheet: rows created after the date in the last filled row, so a run that
+    stopped part way resumes after the last chunk it wrote
+    :param df: Dataframe of rows, columns in worksheet column order
+    :param date_column: worksheet column holding created_at
+    :return: first empty row in worksheet and dataframe of rows to add
+    """
+    first_blank_row = int(next_available_row(worksheet))
+    most_recent_date = worksheet.acell('{}{}'.format(date_column, first_blank_row - 1)).value
+
+    return first_blank_row, df[df['created_at'] > parse(most_recent_date)]
+
+
+def add_new_rows(df, sheet, first_blank_row, gs_client, chunk_size=500, max_retries=3):
+    """
+    Write dataframe rows to worksheet, one contiguous cell range per chunk of rows so a chunk takes a single
+    range read and a single update request. If authorization expires the client logs in again and the chunk
+    is retried, rows from chunks already written are not sent again
+    :param df: Dataframe of rows to add, columns in worksheet column order
+    :param sheet: gspread worksheet (or any object with the same range and update_cells methods)
+    :param first_blank_row: first empty row in worksheet
+    :param gs_client: gspread client, used to refresh authorization
+    :param chunk_size: number of rows written per request
+    :param max_retries: number of times a chunk is retried after logging in again
+    :return: next empty row in worksheet
+    """
+    next_row = int(first_blank_row)
+    last_column = column_letter(len(df.columns))
+    rows = df.values.tolist()
+
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        range_build = 'A{}:{}{}'.format(next_row, last_column, next_row + len(chunk) - 1)
+
+        for attempt in range(max_retries + 1):
+            try:
+                # Cells come back in row-major order, the same order as the flattened rows
+                cell_list = sheet.range(range_build)
+
+                for cell, value in zip(cell_list, chain.from_iterable(chunk)):
+                    cell.value = value
+
+                sheet.update_cells(cell_list)
+                break
+
+            except RequestError:
+                if attempt == max_retries:
+                    print('Stopped after adding {} of {} rows'.format(start, len(rows)))
+                    raise
+
+                # Refresh authorization
+                gs_client.login()
+
+        next_row += len(chunk)
+
+    return next_row
+
+
+def read_export_watermark(path):
+    """
+    Read the tweets load time covered by the last export
+    :return: loaded_at of the newest tweet load exported, None if there is no (current) watermark
+    """
+    if not os.path.exists(path):
+        return None
+
+    with open(path) as f:
+        watermark = json.load(f)
+
+    # Watermarks written before exports tracked load times can't tell which tweets were exported
+    if 'loaded_at' not in watermark:
+        return None
+
+    return pd.Timestamp(watermark['loaded_at']).to_pydatetime()
+
+
+def write_export_watermark(path, loaded_at):
+    """
+    Record the tweets load time covered by an export
+    """
+    with open(path, 'w') as f:
+        json.dump({'loaded_at': pd.Timestamp(loaded_at).isoformat()}, f)
+
+
+def stream_query_to_csv(engine, sql, file, chunk_size=50000, params=None, header=True):
+    """
+    Stream tweet query results from a server side cursor to an open csv file a chunk at a time, so memory
+    doesn't grow with the size of the table
+    :param file: open text file (or gzip file) to write to
+    :param header: write column names before the first chunk
+    :return: number of rows written
+    """
+    rows = 0
+
+    with engine.connect().execution_options(stream_results=True) as connection:
+        for chunk in pd.read_sql_query(text(sql), con=connection, params=params, chunksize=chunk_size):
+            chunk.to_csv(file, header=header and rows == 0, index=False)
+            rows += len(chunk)
+
+    return rows
+
+
+def export_tweets_csv(engine, path, incremental=False, chunk_size=50000):
+    """
+    Export tweet data for Tableau as csv (gzip compressed if path ends with .gz). A full export replaces the file
+    once every row is written. An incremental export appends only tweets first loaded into the db after the last
+    export, whatever their created_at (so backfills, replays and newly added accounts are picked up). Engagement
+    counts of tweets already exported are not refreshed, and exports shouldn't run while tweets are being loaded
+    :param path: csv file to write
+    :param incremental: append new tweets to an existing export instead of rewriting it
+    :param chunk_size: number of rows fetched and written at a time
+    :return: number of rows written
+    """
+    watermark_path = path + '.watermark.json'
+    watermark = read_export_watermark(watermark_path) if incremental and os.path.exists(path) else None
+    open_file = gzip.open if path.endswith('.gz') else open
+    tmp_path = path + '.tmp'
+
+    # Export up to the newest load at this point, so tweets loaded while exporting are left for the next export
+    with engine.connect() as connection:
+        loaded_until = connection.execute(last_loaded_sql).scalar()
+
+    with open_file(tmp_path, 'wt') as f:
+        if loaded_until is None:
+            rows = stream_query_to_csv(engine, tweets_sql, f, chunk_size=chunk_size)
+        elif watermark is None:
+            rows = stream_query_to_csv(engine, tweets_loaded_until_sql, f, chunk_size=chunk_size,
+                                       params={'loaded_until': loaded_until})
+        else:
+            rows = stream_query_to_csv(engine, tweets_loaded_between_sql, f, chunk_size=chunk_size,
+                                       params={'loaded_after': watermark, 'loaded_until': loaded_until},
+                                       header=False)
+
+    if watermark is None:
+        os.replace(tmp_path, path)
+    elif rows > 0:
+        # New rows are appended in one go (a gzip file can hold several compressed members back to back)
+        with open(tmp_path, 'rb') as new_rows, open(path, 'ab') as export:
+            shutil.copyfileobj(new_rows, export)
+        os.remove(tmp_path)
+    else:
+        os.remove(tmp_path)
+
+    if loaded_until is not None:
+        write_export_watermark(watermark_path, loaded_until)
+    elif os.path.exists(watermark_path):
+        os.remove(watermark_path)
+
+    print('{} tweets {} {}'.format(rows, 'appended to' if watermark else 'written to', path))
+    return rows
+
+
+def refresh_tableau_csv_files(incremental=False, compress=False, chunk_size=50000):
+    """
+    Write legislator summary and tweet data csv files for Tableau
+    :param incremental: only append tweets added since the last export
+    :param compress: gzip the tweet data (tweet_data.csv.gz)
+    :param chunk_size: number of tweets fetched and written at a time
+    """
     # Connect to aws and read legislator summary
     engine = db_create_engine(config_file='config.ini', conn_name='PostgresConfig')
+
+    # Tweet exports are watermarked on tweets.loaded_at, added by migrate_schema
+    missing = missing_columns(engine)
+    if missing:
+        raise RuntimeError('Database schema is out of date (missing {}), run `flask migrate_schema` to upgrade it '
+                           'first'.format(', '.join(missing)))
+
     legislator_summary = pd.read_sql(sql=legislators_sql, con=engine)
-    all_tweets = pd.read_sql(sql=tweets_sql, con=engine)
 
     # Write data to csv
     legislator_summary.to_csv('data/csv-tableau-source/legislator_summary.csv', index=False)
-    all_tweets.to_csv('data/csv-tableau-source/tweet_data.csv', index=False)
+
+    tweets_path = 'data/csv-tableau-source/tweet_data.csv' + ('.gz' if compress else '')
+    export_tweets_csv(engine, tweets_path, incremental=incremental, chunk_size=chunk_size)
+
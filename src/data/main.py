@@ -1,37 +1,53 @@
 from flask import Flask
+import click
 import pandas as pd
-import pickle
 from datetime import datetime, timedelta
-import gzip
 import yaml
 from dateutil.parser import parse
 from sqlalchemy.ext.declarative import declarative_base
-from configparser import ConfigParser
 from sqlalchemy.dialects.postgresql import INTEGER, VARCHAR, DATE
 from sqlalchemy.types import DateTime
 from sqlalchemy.orm import sessionmaker, relationship
-from sqlalchemy import Column, ForeignKey, PrimaryKeyConstraint
+from sqlalchemy import Column, ForeignKey, PrimaryKeyConstraint, Index
 import src.data.db_functions as db_funcs
-from src.data.sql_queries import last_updated_sql
-from src.data.export_data import create_gs_client, next_available_row, add_new_rows
+from src.data.export_data import create_gs_client, find_new_rows, add_new_rows, refresh_tableau_csv_files
 from src.data.sql_queries import past_week_tweets_sql
+from src.data.pipeline import stream_load_tweets, gather_tweets, load_interim_data
+from src.data.storage import write_frame, read_frame
+from src.data.raw_archive import RawTweetArchive
+from src.instrumentation import RunMetrics
 
 
 app = Flask(__name__)
 
 
+def require_current_schema(engine):
+    """
+    Stop a load command before fetching anything if the db is missing columns the loads write
+    """
+    missing = db_funcs.missing_columns(engine)
+
+    if missing:
+        raise click.ClickException('Database schema is out of date (missing {}), run `flask migrate_schema` to '
+                                   'upgrade it first'.format(', '.join(missing)))
+
+
 @app.cli.command()
-def initial_data_gather():
+@click.option('--workers', default=1, help='Number of timelines to fetch concurrently')
+@click.option('--trace-memory', is_flag=True, help='Record peak memory of each stage in the run metrics')
+def initial_data_gather(workers, trace_memory):
     """
     Gathers past 30 days legislator twitter data
     """
+    metrics = RunMetrics('initial_data_gather', trace_memory=trace_memory)
 
     # Import legislator YAML files as pandas dataframes
     print('Begin data gathering...')
-    with open('congress-legislators/legislators-current.yaml', 'r') as f:
-        current_legis = pd.io.json.json_normalize(yaml.load(f))
-    with open('congress-legislators/legislators-social-media.yaml', 'r') as f:
-        social = pd.io.json.json_normalize(yaml.load(f))
+    with metrics.stage('legislators'):
+        with open('congress-legislators/legislators-current.yaml', 'r') as f:
+            current_legis = pd.io.json.json_normalize(yaml.load(f))
+        with open('congress-legislators/legislators-social-media.yaml', 'r') as f:
+            social = pd.io.json.json_normalize(yaml.load(f))
 
     # Create target column and subset relevant columns
     current_legis['party'] = [term[0]['party'] for term in current_legis['terms']]
@@ -41,52 +57,34 @@ def initial_data_gather():
     social_cols = ['id.bioguide', 'social.facebook', 'social.twitter', 'social.twitter_id']
 
     # Pickle data in dataframe format
-    current_legis[legis_cols].to_pickle('data/interim/current_legislators_df.pkl')
-    social[social_cols].to_pickle('data/interim/legislators_social_df.pkl')
-    print('Legislator data pickled!')
-
-    def pickle_legislator_tweets(config_file, list_screen_names, last_date):
-
-        # Fetch corresponding Twitter data for legislators over past 30 days
-        config = ConfigParser()
-        config.read(config_file)
-
-        # Instantiate Twitter API connection
-        api = db_funcs.TwAPI(consumer_key=config.get('TwitterKeys', 'consumer_key'),
-                             consumer_secret=config.get('TwitterKeys', 'consumer_secret'),
-                             access_token=config.get('TwitterKeys', 'access_token'),
-                             access_token_secret=config.get('TwitterKeys', 'access_token_secret'))
-
-        # Fetch twitter timeline data and pickle in dataframe format
-        time_lines = api.fetch_all_timelines(screen_names=list_screen_names,
-                                             last_date=last_date,
-                                             include_rts=False)
-
-        with gzip.open('data/raw/raw_tweets.pickle', 'wb') as file:
-            pickle.dump(time_lines, file)
-
-        users_df, tweets_df = db_funcs.create_dataframes_from_tweet_json(time_lines)
-        tweets_df.to_pickle('data/interim/tweets_df.pkl')
-        users_df.to_pickle('data/interim/users_df.pkl')
-
-        print('Pickled data completed!')
+    write_frame(current_legis[legis_cols], 'data/interim/current_legislators_df.parquet')
+    write_frame(social[social_cols], 'data/interim/legislators_social_df.parquet')
+    print('Legislator data saved!')
 
     # Subset social data to only include those with valid twitter id
     twitter_social = social.dropna(subset=['social.twitter_id'])
     list_names = list(twitter_social['social.twitter'])
     month_ago = datetime.now() - timedelta(days=30)
 
+    # Fetch twitter timeline data and save it in dataframe format
     print('Fetching Twitter data now...')
-    pickle_legislator_tweets(config_file='config.ini',
-                             list_screen_names=list_names,
-                             last_date=month_ago)
+    gather_tweets(api=db_funcs.get_twitter_client('config.ini'),
+                  screen_names=list_names,
+                  last_date=month_ago,
+                  archive=RawTweetArchive(),
+                  max_workers=workers,
+                  metrics=metrics)
+
+    metrics.write()
 
 
 @app.cli.command()
-def initial_data_load_db():
+@click.option('--trace-memory', is_flag=True, help='Record peak memory of each stage in the run metrics')
+def initial_data_load_db(trace_memory):
     """
     Populates db with legislator twitter data
     """
+    metrics = RunMetrics('initial_data_load_db', trace_memory=trace_memory)
 
     connection_name = input("Name config details in 'config.ini' file: ")
 
@@ -115,7 +113,7 @@ def initial_data_load_db():
         __tablename__ = 'social'
         legislator_id = Column(VARCHAR(250), ForeignKey('legislators.legislator_id'), primary_key=True)
         facebook = Column(VARCHAR(250))
-        twitter_screen_name = Column(VARCHAR(250))
+        twitter_screen_name = Column(VARCHAR(250), index=True)
         twitter_id = Column(VARCHAR(250))
 
         twitter_accounts = relationship('Profile_Log', foreign_keys=['id'],
@@ -136,16 +134,24 @@ def initial_data_load_db():
         profile_image_url = Column(VARCHAR(250))
         time_zone = Column(VARCHAR(200))
         time_collected = Column(DateTime)
+        collected_date = Column(DATE)
 
         __table_args__ = (
             PrimaryKeyConstraint('screen_name', 'time_collected'),
+            Index('ix_user_profile_log_screen_name_collected_date', 'screen_name', 'collected_date'),
             {},
         )
 
+    class Timeline_Watermarks(Base):
+        __tablename__ = 'timeline_watermarks'
+        twitter_screen_name = Column(VARCHAR(250), primary_key=True)
+        since_id = Column(VARCHAR(30))
+        updated_at = Column(DateTime)
+
     class Tweets(Base):
         __tablename__ = 'tweets'
         id = Column(INTEGER, primary_key=True, autoincrement=True)
-        tweet_id = Column(VARCHAR(30))
+        tweet_id = Column(VARCHAR(30), unique=True)
         twitter_screen_name = Column(VARCHAR(250))
         created_at = Column(DateTime)
         hashtags = Column(VARCHAR(300))
@@ -158,74 +164,176 @@ def initial_data_load_db():
         media_type = Column(VARCHAR(200))
         user_mentions = Column(VARCHAR(250))
         time_collected = Column(DateTime)
+        collected_date = Column(DATE)
+        loaded_at = Column(DateTime, index=True)
+
+        __table_args__ = (
+            Index('ix_tweets_screen_name_created_at', 'twitter_screen_name', 'created_at'),
+            Index('ix_tweets_screen_name_collected_date', 'twitter_screen_name', 'collected_date'),
+            {},
+        )
 
     Base.metadata.create_all(engine)
 
     print('Transforming data for ingest now...')
-
-    # Read in data
-    legislators = pd.read_pickle('data/interim/current_legislators_df.pkl')
-    social = pd.read_pickle('data/interim/legislators_social_df.pkl')
-    user_profile_log = pd.read_pickle('data/interim/users_df.pkl')
-    tweets = pd.read_pickle('data/interim/tweets_df.pkl')
-
-    db_funcs.load_tweets_table(df=tweets, engine=engine, if_exists='replace')
-    db_funcs.load_user_profile_table(df=user_profile_log, engine=engine, if_exists='replace')
-    db_funcs.load_social_table(df=social, engine=engine, if_exists='replace')
-    db_funcs.load_legislator_table(df=legislators, engine=engine, if_exists='replace')
+    load_interim_data(engine, metrics=metrics)
 
     session.close_all()
     print('Database successfully created!')
+    metrics.write()
 
 
 @app.cli.command()
-def load_new_twitter_data():
+@click.option('--workers', default=1, help='Number of timelines to fetch concurrently')
+@click.option('--trace-memory', is_flag=True, help='Record peak memory of each stage in the run metrics')
+def load_new_twitter_data(workers, trace_memory):
     """
     Fetch new twitter data and populate db
     """
+    metrics = RunMetrics('load_new_twitter_data', trace_memory=trace_memory)
 
-    social = pd.read_pickle('data/interim/legislators_social_df.pkl')
+    social = read_frame('data/interim/legislators_social_df.parquet', columns=['social.twitter', 'social.twitter_id'])
 
     # Find latest update
     engine = db_funcs.db_create_engine(config_file='config.ini', conn_name='PostgresConfig')
+    require_current_schema(engine)
 
     twitter_social = social.dropna(subset=['social.twitter_id'])
     list_names = list(twitter_social['social.twitter'])
 
-    last_updated = pd.read_sql_query(sql=last_updated_sql, con=engine)
-    last_updated_time = last_updated.iloc[0, 0]
+    # Accounts without a since_id watermark fetch tweets since the start of the last completed run
+    last_updated_time = db_funcs.fetch_last_completed_run(engine)
+    started_at = datetime.utcnow()
+
+    # Accounts with a since_id watermark only page through tweets newer than their last collected tweet
+    since_ids = db_funcs.fetch_timeline_watermarks(engine)
 
     # Fetch corresponding Twitter data for legislators since last day fetched
-    config = ConfigParser()
-    config.read('config.ini')
-
-    api = db_funcs.TwAPI(consumer_key=config.get('TwitterKeys', 'consumer_key'),
-                         consumer_secret=config.get('TwitterKeys', 'consumer_secret'),
-                         access_token=config.get('TwitterKeys', 'access_token'),
-                         access_token_secret=config.get('TwitterKeys', 'access_token_secret'))
-
-    # Pickle the raw tweets before transforming to dataframe in interim pickle files
-    print('Fetching tweets created since {}'.format(last_updated_time))
-    recent_tweets = api.fetch_all_timelines(screen_names=list_names,
-                                            last_date=last_updated_time)
-    with gzip.open('data/raw/raw_tweets.pickle', 'wb') as file:
-        pickle.dump(recent_tweets, file)
-
-    # Pickle interim data before loading into sql database
-    users_df, tweets_df = db_funcs.create_dataframes_from_tweet_json(recent_tweets)
-
-    tweets_df.to_pickle('data/interim/tweets_df.pkl')
-    users_df.to_pickle('data/interim/users_df.pkl')
+    api = db_funcs.get_twitter_client('config.ini')
+
+    # Archive the raw tweets before transforming to dataframe in interim files
+    print('Fetching tweets created since {} ({} accounts with since_id watermarks)'
+          .format(last_updated_time, len(since_ids)))
+    with metrics.stage('fetch'):
+        recent_tweets = api.fetch_all_timelines(screen_names=list_names,
+                                                last_date=last_updated_time,
+                                                max_workers=workers,
+                                                since_ids=since_ids)
+    metrics.count('fetch', len(recent_tweets))
+    time_collected = datetime.utcnow()
+
+    with metrics.stage('raw_archive', rows=len(recent_tweets)):
+        RawTweetArchive().append(recent_tweets, collected_at=time_collected)
+
+    # Save interim data before loading into sql database
+    with metrics.stage('normalize', rows=len(recent_tweets)):
+        users_df, tweets_df = db_funcs.create_dataframes_from_tweet_json(recent_tweets, time_collected=time_collected)
+
+    with metrics.stage('write_interim', rows=len(tweets_df)):
+        write_frame(tweets_df, 'data/interim/tweets_df.parquet')
+        write_frame(users_df, 'data/interim/users_df.parquet')
     print('{} new tweets identified by {} distinct legislators'.format(len(tweets_df), len(users_df)))
 
     # Append new data to sql database tables
-    db_funcs.load_user_profile_table(df=users_df, engine=engine, if_exists='append')
-    db_funcs.load_tweets_table(df=tweets_df, engine=engine, if_exists='append')
+    with metrics.stage('load', rows=len(tweets_df)):
+        db_funcs.load_user_profile_table(df=users_df, engine=engine, if_exists='append')
+        db_funcs.load_tweets_table(df=tweets_df, engine=engine, if_exists='upsert')
+        db_funcs.update_timeline_watermarks(df=tweets_df, engine=engine)
+        db_funcs.record_completed_run(engine, started_at)
     print('Successfully updated!')
+    metrics.write()
 
 
 @app.cli.command()
-def update_google_sheet():
+@click.option('--workers', default=1, help='Number of timelines to fetch concurrently')
+@click.option('--batch-size', default=5000, help='Number of tweets normalized and loaded at a time')
+@click.option('--days', default=None, type=int, help='Backfill this many days instead of fetching since last update')
+@click.option('--trace-memory', is_flag=True, help='Record peak memory of each stage in the run metrics')
+def stream_twitter_data(workers, batch_size, days, trace_memory):
+    """
+    Fetch, normalize and load twitter data in batches as it arrives
+    """
+    metrics = RunMetrics('stream_twitter_data', trace_memory=trace_memory)
+
+    social = read_frame('data/interim/legislators_social_df.parquet', columns=['social.twitter', 'social.twitter_id'])
+    engine = db_funcs.db_create_engine(config_file='config.ini', conn_name='PostgresConfig')
+    require_current_schema(engine)
+
+    twitter_social = social.dropna(subset=['social.twitter_id'])
+    list_names = list(twitter_social['social.twitter'])
+
+    if days is not None:
+        last_date = datetime.utcnow() - timedelta(days=days)
+        since_ids = {}
+    else:
+        last_date = db_funcs.fetch_last_completed_run(engine)
+        since_ids = db_funcs.fetch_timeline_watermarks(engine)
+
+    started_at = datetime.utcnow()
+
+    api = db_funcs.get_twitter_client('config.ini')
+
+    print('Streaming tweets created since {} in batches of {}'.format(last_date, batch_size))
+    pages = api.iter_all_timelines(screen_names=list_names,
+                                   last_date=last_date,
+                                   max_workers=workers,
+                                   since_ids=since_ids)
+
+    tweet_count, user_count = stream_load_tweets(pages, engine=engine, batch_size=batch_size,
+                                                 time_collected=started_at, metrics=metrics,
+                                                 archive=RawTweetArchive())
+    db_funcs.record_completed_run(engine, started_at)
+    print('{} new tweets loaded for {} distinct legislators'.format(tweet_count, user_count))
+    metrics.write()
+
+
+@app.cli.command()
+@click.option('--start', default=None, help='First collection date to replay (YYYY-MM-DD)')
+@click.option('--end', default=None, help='Last collection date to replay (YYYY-MM-DD)')
+@click.option('--screen-names', default=None, help='Comma separated accounts to replay (defaults to all)')
+@click.option('--batch-size', default=5000, help='Number of tweets normalized and loaded at a time')
+@click.option('--trace-memory', is_flag=True, help='Record peak memory of each stage in the run metrics')
+def replay_raw_tweets(start, end, screen_names, batch_size, trace_memory):
+    """
+    Load tweets from the raw archive into the db without refetching them, one segment at a time
+    """
+    metrics = RunMetrics('replay_raw_tweets', trace_memory=trace_memory)
+    engine = db_funcs.db_create_engine(config_file='config.ini', conn_name='PostgresConfig')
+    require_current_schema(engine)
+
+    archive = RawTweetArchive()
+    screen_names = screen_names.split(',') if screen_names else None
+    segments = archive.segments(start=start, end=end, screen_names=screen_names)
+    print('Replaying {} archived segments...'.format(len(segments)))
+
+    tweet_count = 0
+
+    # Each segment keeps the collection time it was fetched at, and profiles already logged at that time
+    # (eg. the segment was loaded when it was fetched) aren't logged twice
+    for segment in segments:
+        time_collected = parse(segment['collected_at'])
+        pages = archive.iter_pages(page_size=batch_size, screen_names=screen_names, segments=[segment])
+        loaded, _ = stream_load_tweets(pages, engine=engine, batch_size=batch_size, time_collected=time_collected,
+                                       metrics=metrics,
+                                       skip_profiles=db_funcs.fetch_collected_profiles(engine, time_collected))
+        tweet_count += loaded
+
+    print('Successfully replayed {} tweets!'.format(tweet_count))
+    metrics.write()
+
+
+@app.cli.command()
+def migrate_schema():
+    """
+    Add indexes and normalized join key columns to an existing database
+    """
+    engine = db_funcs.db_create_engine(config_file='config.ini', conn_name='PostgresConfig')
+    db_funcs.migrate_schema(engine)
+
+
+@app.cli.command()
+@click.option('--chunk-size', default=500, help='Number of rows written to the sheet per request')
+def update_google_sheet(chunk_size):
     """
     Add new tweets to google sheet for Tableau
     """
@@ -240,18 +348,26 @@ def update_google_sheet():
     past_week = pd.read_sql(sql=past_week_tweets_sql, con=engine)
 
     # Identify and load new tweets in Google Sheet
-    first_blank_row = int(next_available_row(worksheet))
-    most_recent_date = worksheet.acell('E{}'.format(first_blank_row - 1)).value
-
-    new_tweets = past_week[past_week['created_at'] > parse(most_recent_date)]
+    first_blank_row, new_tweets = find_new_rows(past_week, worksheet)
     print('{} new tweets identified. Adding now...'.format(len(new_tweets)))
 
     add_new_rows(df=new_tweets, sheet=worksheet,
-                 first_blank_row=first_blank_row, gs_client=gc)
+                 first_blank_row=first_blank_row, gs_client=gc, chunk_size=chunk_size)
 
     print('Successfully added!')
 
 
+@app.cli.command()
+@click.option('--incremental/--full', default=False, help='Append only tweets added since the last export')
+@click.option('--compress/--no-compress', default=False, help='Write tweet data gzip compressed (tweet_data.csv.gz)')
+@click.option('--chunk-size', default=50000, help='Number of tweets fetched and written at a time')
+def update_tableau_csv_files(incremental, compress, chunk_size):
+    """
+    Write legislator summary and tweet data csv files for Tableau
+    """
+    refresh_tableau_csv_files(incremental=incremental, compress=compress, chunk_size=chunk_size)
+
+
 if __name__ == '__main__':
     initial_data_gather()
     initial_data_load_db()
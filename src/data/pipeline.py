@@ -0,0 +1,153 @@
+import os
+from datetime import datetime
+import pandas as pd
+import src.data.db_functions as db_funcs
+from src.data.storage import write_frame, read_frame
+from src.instrumentation import RunMetrics
+
+
+def batch_tweets(pages, batch_size):
+    """
+    Regroup a stream of tweet pages into batches of at most batch_size tweets
+    :param pages: iterable of lists of json tweets
+    :param batch_size: max number of tweets per batch
+    :return: yields lists of json tweets
+    """
+    batch = []
+
+    for page in pages:
+        batch.extend(page)
+
+        while len(batch) >= batch_size:
+            yield batch[:batch_size]
+            batch = batch[batch_size:]
+
+    if batch:
+        yield batch
+
+
+def stream_load_tweets(pages, engine, batch_size=5000, time_collected=None, metrics=None, archive=None,
+                       skip_profiles=None):
+    """
+    Normalize tweets in bounded-size batches and load each batch into the database as soon as it is ready,
+    so memory use does not grow with the number of tweets collected
+    :param pages: iterable of lists of json tweets (see TwAPI.iter_all_timelines)
+    :param engine: sqlAlchemy engine connected to database
+    :param batch_size: number of tweets normalized and loaded at a time
+    :param time_collected: collection timestamp shared by every batch in the run (defaults to now)
+    :param metrics: RunMetrics to record fetch, normalize and load stages in
+    :param archive: RawTweetArchive each batch of raw tweets is appended to before it is loaded
+    :param skip_profiles: lowercase screen names whose profile is already logged at time_collected
+    :return: number of tweets loaded and number of distinct accounts seen
+    """
+    time_collected = time_collected or datetime.utcnow()
+    metrics = metrics or RunMetrics('stream_load_tweets')
+
+    # One profile row per account per run (user_profile_log is keyed on screen name and time collected)
+    loaded_users = set(skip_profiles or ())
+    seen_users = set()
+    newest_tweets = {}
+    tweet_count = 0
+
+    for batch in batch_tweets(metrics.timed_iter('fetch', pages), batch_size):
+        if archive is not None:
+            with metrics.stage('raw_archive', rows=len(batch)):
+                archive.append(batch, collected_at=time_collected)
+
+        with metrics.stage('normalize', rows=len(batch)):
+            users_df, tweets_df = db_funcs.create_dataframes_from_tweet_json(batch, time_collected=time_collected)
+
+            users_df = users_df[~users_df['user.screen_name'].str.lower().isin(loaded_users)]
+            loaded_users.update(users_df['user.screen_name'].str.lower())
+
+        with metrics.stage('load', rows=len(tweets_df)):
+            if len(users_df) > 0:
+                db_funcs.load_user_profile_table(df=users_df, engine=engine, if_exists='append')
+            db_funcs.load_tweets_table(df=tweets_df, engine=engine, if_exists='upsert')
+
+        for screen_name, tweet_ids in tweets_df.groupby('twitter_screen_name')['tweet_id']:
+            newest = max(tweet_ids, key=int)
+            if int(newest) > int(newest_tweets.get(screen_name, 0)):
+                newest_tweets[screen_name] = newest
+
+        seen_users.update(tweets_df['twitter_screen_name'])
+        tweet_count += len(tweets_df)
+        print('{} tweets loaded so far'.format(tweet_count))
+
+    # Watermarks move only once the whole run is loaded, so accounts with a watermark are refetched from their last
+    # loaded tweet after an interrupted run. Accounts without one are refetched from the start of the last completed
+    # run, which callers record with record_completed_run once this returns
+    if newest_tweets:
+        with metrics.stage('load'):
+            db_funcs.update_timeline_watermarks(df=pd.DataFrame({'twitter_screen_name': list(newest_tweets.keys()),
+                                                                 'tweet_id': list(newest_tweets.values())}),
+                                                engine=engine)
+
+    return tweet_count, len(seen_users)
+
+
+def gather_tweets(api, screen_names, last_date, directory='data/interim', archive=None, max_workers=1, metrics=None):
+    """
+    Fetch timelines, archive the raw tweets and save them as interim tweets and user profile files
+    (the twitter steps of initial_data_gather)
+    :param api: TwAPI (or ReplayTwAPI) to fetch timelines with
+    :param screen_names: accounts to fetch
+    :param last_date: fetch tweets created since this date
+    :param directory: directory the interim parquet files are written to
+    :param archive: RawTweetArchive the raw tweets are appended to (None doesn't archive them)
+    :param max_workers: number of timelines to fetch concurrently
+    :param metrics: RunMetrics to record fetch, archive, normalize and write stages in
+    :return: number of tweets fetched
+    """
+    metrics = metrics or RunMetrics('gather_tweets')
+
+    with metrics.stage('fetch'):
+        time_lines = api.fetch_all_timelines(screen_names=screen_names,
+                                             last_date=last_date,
+                                             include_rts=False,
+                                             max_workers=max_workers)
+    metrics.count('fetch', len(time_lines))
+    time_collected = datetime.utcnow()
+
+    if archive is not None:
+        with metrics.stage('raw_archive', rows=len(time_lines)):
+            archive.append(time_lines, collected_at=time_collected)
+
+    with metrics.stage('normalize', rows=len(time_lines)):
+        users_df, tweets_df = db_funcs.create_dataframes_from_tweet_json(time_lines, time_collected=time_collected)
+
+    with metrics.stage('write_interim', rows=len(tweets_df)):
+        write_frame(tweets_df, os.path.join(directory, 'tweets_df.parquet'))
+        write_frame(users_df, os.path.join(directory, 'users_df.parquet'))
+
+    print('Interim data saved!')
+    return len(time_lines)
+
+
+def load_interim_data(engine, directory='data/interim', metrics=None):
+    """
+    Replace the tweets, user profile, social and legislator tables with the interim files and bring the schema
+    up to date (the load steps of initial_data_load_db)
+    :param engine: sqlAlchemy engine connected to database
+    :param directory: directory holding the interim parquet files
+    :param metrics: RunMetrics to record read, load and migrate stages in
+    """
+    metrics = metrics or RunMetrics('load_interim_data')
+
+    with metrics.stage('read_interim'):
+        legislators = read_frame(os.path.join(directory, 'current_legislators_df.parquet'))
+        social = read_frame(os.path.join(directory, 'legislators_social_df.parquet'))
+        user_profile_log = read_frame(os.path.join(directory, 'users_df.parquet'))
+        tweets = read_frame(os.path.join(directory, 'tweets_df.parquet'))
+    metrics.count('read_interim', len(tweets))
+
+    with metrics.stage('load', rows=len(tweets)):
+        db_funcs.load_tweets_table(df=tweets, engine=engine, if_exists='replace')
+        db_funcs.update_timeline_watermarks(df=tweets, engine=engine)
+        db_funcs.load_user_profile_table(df=user_profile_log, engine=engine, if_exists='replace')
+        db_funcs.load_social_table(df=social, engine=engine, if_exists='replace')
+        db_funcs.load_legislator_table(df=legislators, engine=engine, if_exists='replace')
+
+    # Tables are recreated from the dataframes above, so add indexes and constraints back
+    with metrics.stage('migrate'):
+        db_funcs.migrate_schema(engine)
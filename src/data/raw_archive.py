@@ -0,0 +1,167 @@
+import os
+import json
+import gzip
+from datetime import datetime
+
+
+class RawTweetArchive:
+
+    def __init__(self, root='data/raw/archive'):
+        """
+        Initialize append-only archive of raw tweet json. Each collection run is written as a gzip json lines
+        segment in a partition per collection date (root/date=YYYY-MM-DD/). Segments are never rewritten, and
+        an index (root/index.jsonl) records per segment the collection time and, per screen name, the number of
+        tweets and their lowest and highest tweet id, so reads only open the segments they need
+        :param root: archive directory
+        """
+        self.root = root
+        self.index_path = os.path.join(root, 'index.jsonl')
+
+    def append(self, tweets, collected_at=None):
+        """
+        Write tweets as a new segment in the partition of their collection date and add it to the index
+        :param tweets: iterable of json tweets (eg. output of TwAPI.fetch_all_timelines)
+        :param collected_at: collection timestamp (defaults to now, UTC)
+        :return: index entry of the new segment, None if there were no tweets
+        """
+        collected_at = collected_at or datetime.utcnow()
+        partition = os.path.join(self.root, 'date={}'.format(collected_at.strftime('%Y-%m-%d')))
+        os.makedirs(partition, exist_ok=True)
+
+        name = 'tweets-{}'.format(collected_at.strftime('%Y%m%dT%H%M%S%f'))
+        suffix = 0
+        while os.path.exists(os.path.join(partition, name + '.jsonl.gz')):
+            suffix += 1
+            name = 'tweets-{}-{}'.format(collected_at.strftime('%Y%m%dT%H%M%S%f'), suffix)
+
+        path = os.path.join(partition, name + '.jsonl.gz')
+        accounts = {}
+        count = 0
+
+        # Segment only gets its final name (and index entry) once it's completely written
+        with gzip.open(path + '.tmp', 'wt', encoding='utf-8') as f:
+            for tweet in tweets:
+                f.write(json.dumps(tweet, separators=(',', ':')))
+                f.write('\n')
+
+                tweet_id = int(tweet['id_str'] if 'id_str' in tweet else tweet['id'])
+                screen_name = tweet['user']['screen_name'].lower()
+                account = accounts.setdefault(screen_name, [0, tweet_id, tweet_id])
+                account[0] += 1
+                account[1] = min(account[1], tweet_id)
+                account[2] = max(account[2], tweet_id)
+                count += 1
+
+        if count == 0:
+            os.remove(path + '.tmp')
+            return None
+
+        os.replace(path + '.tmp', path)
+
+        entry = {'segment': os.path.relpath(path, self.root).replace(os.sep, '/'),
+                 'collected_at': collected_at.isoformat(),
+                 'tweets': count,
+                 'accounts': accounts}
+
+        with open(self.index_path, 'a') as f:
+            f.write(json.dumps(entry, sort_keys=True))
+            f.write('\n')
+
+        print('{} raw tweets archived to {}'.format(count, path))
+        return entry
+
+    def index(self):
+        """
+        :return: list of index entries, oldest segment first
+        """
+        if not os.path.exists(self.index_path):
+            return []
+
+        with open(self.index_path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def segments(self, start=None, end=None, screen_names=None, tweet_id=None):
+        """
+        Find the segments that may hold the requested tweets using the index only
+        :param start: first collection date to include (date or 'YYYY-MM-DD', inclusive)
+        :param end: last collection date to include (date or 'YYYY-MM-DD', inclusive)
+        :param screen_names: only segments with tweets by these accounts (case insensitive)
+        :param tweet_id: only segments whose id range for some account includes this tweet id
+        :return: list of index entries
+        """
+        start = str(start) if start is not None else None
+        end = str(end) if end is not None else None
+        names = set(name.lower() for name in screen_names) if screen_names is not None else None
+
+        selected = []
+
+        for entry in self.index():
+            collected_on = entry['collected_at'][:10]
+
+            if (start is not None and collected_on < start) or (end is not None and collected_on > end):
+                continue
+
+            accounts = entry['accounts']
+
+            if names is not None and names.isdisjoint(accounts):
+                continue
+
+            if tweet_id is not None and not any(low <= int(tweet_id) <= high for _, low, high in
+                                                (accounts[name] for name in (names or accounts) if name in accounts)):
+                continue
+
+            selected.append(entry)
+
+        return selected
+
+    def iter_tweets(self, start=None, end=None, screen_names=None, segments=None):
+        """
+        Stream archived tweets one segment at a time, oldest segment first
+        :param start: first collection date to include (inclusive)
+        :param end: last collection date to include (inclusive)
+        :param screen_names: only tweets by these accounts (case insensitive)
+        :param segments: index entries to read (defaults to the segments matching start, end and screen_names)
+        :return: yields json tweets
+        """
+        names = set(name.lower() for name in screen_names) if screen_names is not None else None
+
+        if segments is None:
+            segments = self.segments(start=start, end=end, screen_names=screen_names)
+
+        for entry in segments:
+            with gzip.open(os.path.join(self.root, entry['segment']), 'rt', encoding='utf-8') as f:
+                for line in f:
+                    tweet = json.loads(line)
+
+                    if names is None or tweet['user']['screen_name'].lower() in names:
+                        yield tweet
+
+    def iter_pages(self, page_size=1000, **kwargs):
+        """
+        Stream archived tweets in lists of at most page_size tweets (eg. to replay into stream_load_tweets).
+        Keyword arguments are passed to iter_tweets
+        """
+        page = []
+
+        for tweet in self.iter_tweets(**kwargs):
+            page.append(tweet)
+
+            if len(page) >= page_size:
+                yield page
+                page = []
+
+        if page:
+            yield page
+
+    def get(self, tweet_id):
+        """
+        Look up an archived tweet by id, reading only segments whose index ranges include it
+        :return: most recently collected copy of the tweet, None if it isn't archived
+        """
+        for entry in reversed(self.segments(tweet_id=tweet_id)):
+            for tweet in self.iter_tweets(segments=[entry]):
+                if str(tweet.get('id_str', tweet['id'])) == str(tweet_id):
+                    return tweet
+
+        return None
+
@@ -0,0 +1,169 @@
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import tweepy
+from src.data.db_functions import TwAPI
+from src.data.synthetic_tweets import synthetic_timelines
+
+
+def not_found_error(message):
+    """
+    TweepError shaped like the API's 404 response, so callers skip missing accounts and tweets as they do live
+    """
+    return tweepy.TweepError(message, response=SimpleNamespace(status_code=404))
+
+
+class ReplayTwAPI(TwAPI):
+
+    def __init__(self, timelines, page_size=200, max_timeline=3200, rate_limiter=None, latency=0.0, jitter=0.0,
+                 seed=0):
+        """
+        Initialize offline stand-in for TwAPI, serving timelines and statuses from recorded or synthetic tweet json
+        through the same methods (fetch_user_timeline, fetch_all_timelines, get_status, ...). Nothing is sent to
+        Twitter, so ingestion can be load tested without using up the rate limits
+        :param timelines: dictionary of screen name to list of json tweets, newest first (see synthetic_timelines)
+        :param page_size: number of tweets per timeline page (the API returns up to 200)
+        :param max_timeline: number of most recent tweets of a timeline that can be paged through (3200 on the API)
+        :param rate_limiter: RateLimiter each timeline page is drawn from, eg. RateLimiter(max_calls=900, period=1)
+        replays 15 minute windows a second at a time (None doesn't throttle)
+        :param latency: seconds each simulated request takes
+        :param jitter: max seconds of extra latency added to each request (uniformly distributed)
+        :param seed: random seed for jitter
+        """
+        self.timelines = {screen_name.lower(): timeline for screen_name, timeline in timelines.items()}
+        self.page_size = page_size
+        self.max_timeline = max_timeline
+        self.rate_limiter = rate_limiter
+        self.latency = latency
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.statuses = None
+        self.requests = Counter()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    @classmethod
+    def from_synthetic(cls, n_tweets, n_accounts=535, seed=0, days=30, **kwargs):
+        """
+        Replay API serving deterministic synthetic timelines (see synthetic_timelines) spread over the past days
+        :param n_tweets: total number of tweets across all accounts
+        :param n_accounts: number of accounts (screen names Rep0000, Rep0001, ...)
+        :param days: tweets are spread evenly over this many days up to now
+        :return: ReplayTwAPI (remaining keyword arguments are passed to the constructor)
+        """
+        timelines = synthetic_timelines(n_tweets, n_accounts=n_accounts, seed=seed,
+                                        start=datetime.utcnow() - timedelta(days=days), days=days)
+
+        return cls(timelines, seed=seed, **kwargs)
+
+    @classmethod
+    def from_archive(cls, archive, start=None, end=None, screen_names=None, **kwargs):
+        """
+        Replay API serving tweets recorded in a RawTweetArchive (the most recently collected copy of each tweet)
+        :param start: first collection date to read (inclusive)
+        :param end: last collection date to read (inclusive)
+        :param screen_names: only serve these accounts
+        :return: ReplayTwAPI (remaining keyword arguments are passed to the constructor)
+        """
+        tweets = {}
+
+        for tweet in archive.iter_tweets(start=start, end=end, screen_names=screen_names):
+            tweets[tweet['id_str']] = tweet
+
+        timelines = {}
+
+        for tweet in tweets.values():
+            timelines.setdefault(tweet['user']['screen_name'], []).append(tweet)
+
+        for timeline in timelines.values():
+            timeline.sort(key=lambda tweet: int(tweet['id_str']), reverse=True)
+
+        return cls(timelines, **kwargs)
+
+    def simulate_request(self, endpoint, rate_limited=False):
+        """
+        Count a request to endpoint and wait out its simulated latency (and rate limit budget if rate_limited)
+        """
+        if rate_limited and self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+
+        with self.lock:
+            self.requests[endpoint] += 1
+            delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0.0)
+
+        if delay > 0:
+            time.sleep(delay)
+
+    def timeline_pages(self, screen_name, include_rts=False, since_id=None):
+        """
+        Generator of timeline pages (newest first) for a replayed screen name, paged like the API: every page,
+        and the final empty response, is one request drawn from the rate limit budget
+        :param since_id: only return tweets newer than this tweet id
+        :return: yields lists of json tweets
+        """
+        timeline = self.timelines.get(screen_name.lower())
+
+        if timeline is None:
+            self.simulate_request('statuses/user_timeline', rate_limited=True)
+            raise not_found_error('Twitter error response: status code = 404')
+
+        timeline = timeline[:self.max_timeline]
+
+        if not include_rts:
+            timeline = [tweet for tweet in timeline if 'retweeted_status' not in tweet]
+
+        if since_id is not None:
+            timeline = [tweet for tweet in timeline if int(tweet['id_str']) > int(since_id)]
+
+        start = 0
+
+        while True:
+            self.simulate_request('statuses/user_timeline', rate_limited=True)
+            page = timeline[start:start + self.page_size]
+
+            if not page:
+                return
+
+            yield page
+            start += self.page_size
+
+    def status_index(self):
+        """
+        Dictionary of tweet id string to json tweet across all replayed timelines, built on first use
+        """
+        with self.lock:
+            if self.statuses is None:
+                self.statuses = {tweet['id_str']: tweet for timeline in self.timelines.values() for tweet in timeline}
+
+            return self.statuses
+
+    def get_status(self, tweet_id, timeout=None):
+        """
+        Fetch a single replayed tweet by id
+        :return: json tweet
+        """
+        self.simulate_request('statuses/show')
+        tweet = self.status_index().get(str(tweet_id))
+
+        if tweet is None:
+            raise not_found_error('Twitter error response: status code = 404')
+
+        return tweet
+
+    def lookup_statuses(self, tweet_ids, batch_size=100, timeout=None):
+        """
+        Fetch replayed tweets in bulk by id, one simulated request per batch
+        :return: list of json tweets - ids that aren't replayed are omitted
+        """
+        statuses = self.status_index()
+        tweet_list = []
+
+        for start in range(0, len(tweet_ids), batch_size):
+            self.simulate_request('statuses/lookup')
+            tweet_list.extend(statuses[str(tweet_id)] for tweet_id in tweet_ids[start:start + batch_size]
+                              if str(tweet_id) in statuses)
+
+        return tweet_list
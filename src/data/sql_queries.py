@@ -49,15 +49,16 @@ past_week_tweets_sql = """
         t.retweet_count
     FROM tweets t
     LEFT JOIN social s
-        ON lower(t.twitter_screen_name) = lower(s.twitter_screen_name)
+        ON t.twitter_screen_name = s.twitter_screen_name
     LEFT JOIN legislators l
         ON s.legislator_id = l.legislator_id
     WHERE l.party <> 'Independent'
-        AND DATE(t.created_at) >= DATE(localtimestamp - INTERVAL '7 day')
+        AND t.created_at >= CAST(localtimestamp - INTERVAL '7 day' AS DATE)
     ORDER BY t.created_at;
 """
 
-tweets_sql = """
+# Tweets with legislator and follower data - {filters} narrows the rows (see tweets_sql and the export queries)
+tweets_select_sql = """
     SELECT l.first_name || ' ' || l.last_name as name,
         l.party,
         l.gender,
@@ -79,11 +80,194 @@ tweets_sql = """
     LEFT JOIN legislators l
         ON s.legislator_id = l.legislator_id
     LEFT JOIN user_profile_log u
-        ON (t.twitter_screen_name = u.screen_name AND DATE(t.time_collected) = DATE(u.time_collected))
-    WHERE l.party <> 'Independent'
+        ON (t.twitter_screen_name = u.screen_name AND t.collected_date = u.collected_date)
+    WHERE l.party <> 'Independent'{filters}
     GROUP BY 1,2,3,4,5,6,7,8,9,10,11,12,13,14;
 """
 
+tweets_sql = tweets_select_sql.format(filters='')
+
+# Tweets first loaded up to a point in time (a full export), or between two points in time (an incremental export)
+tweets_loaded_until_sql = tweets_select_sql.format(filters="""
+        AND t.loaded_at <= :loaded_until""")
+
+tweets_loaded_between_sql = tweets_select_sql.format(filters="""
+        AND t.loaded_at > :loaded_after
+        AND t.loaded_at <= :loaded_until""")
+
+last_loaded_sql = """
+    SELECT max(loaded_at) from tweets;
+    """
+
+tweet_text_sql = """
+    SELECT t.tweet_id,
+        t.text
+    FROM tweets t
+    LEFT JOIN social s
+        ON t.twitter_screen_name = s.twitter_screen_name
+    LEFT JOIN legislators l
+        ON s.legislator_id = l.legislator_id
+    WHERE l.party <> 'Independent';
+"""
+
 last_updated_sql = """
     SELECT max(time_collected) from user_profile_log;
-    """
\ No newline at end of file
+    """
+
+# Start time of each fetch run that finished loading - accounts without a since_id watermark are refetched
+# from the start of the last completed run, so tweets an interrupted run didn't load are fetched again
+completed_runs_table_sql = """
+    CREATE TABLE IF NOT EXISTS completed_runs (
+        started_at TIMESTAMP,
+        finished_at TIMESTAMP);
+    """
+
+record_completed_run_sql = """
+    INSERT INTO completed_runs (started_at, finished_at) VALUES (:started_at, :finished_at);
+    """
+
+last_completed_run_sql = """
+    SELECT max(started_at) from completed_runs;
+    """
+
+timeline_watermarks_sql = """
+    SELECT twitter_screen_name, since_id from timeline_watermarks;
+    """
+
+timeline_watermarks_table_sql = [
+    """
+    CREATE TABLE IF NOT EXISTS timeline_watermarks (
+        twitter_screen_name VARCHAR(250) PRIMARY KEY,
+        since_id VARCHAR(30),
+        updated_at TIMESTAMP);
+    """,
+    # Tables written by earlier versions (DataFrame.to_sql) have no primary key
+    """
+    CREATE UNIQUE INDEX IF NOT EXISTS ix_timeline_watermarks_screen_name ON timeline_watermarks (twitter_screen_name);
+    """,
+]
+
+# Watermarks only ever move forward, even if a concurrent run recorded a newer tweet first
+upsert_timeline_watermark_sql = """
+    INSERT INTO timeline_watermarks (twitter_screen_name, since_id, updated_at)
+    VALUES (:twitter_screen_name, :since_id, :updated_at)
+    ON CONFLICT (twitter_screen_name) DO UPDATE SET since_id = EXCLUDED.since_id, updated_at = EXCLUDED.updated_at
+    WHERE CAST(timeline_watermarks.since_id AS BIGINT) < CAST(EXCLUDED.since_id AS BIGINT);
+    """
+
+collected_profiles_sql = """
+    SELECT screen_name from user_profile_log WHERE time_collected = :time_collected;
+    """
+
+dedupe_tweets_postgres_sql = """
+    DELETE FROM tweets t
+    USING (
+        SELECT ctid,
+            row_number() OVER (PARTITION BY tweet_id ORDER BY time_collected DESC) as row_num
+        FROM tweets
+        ) d
+    WHERE t.ctid = d.ctid
+        AND d.row_num > 1;
+    """
+
+dedupe_tweets_sql = """
+    DELETE FROM tweets
+    WHERE rowid <> (
+        SELECT d.rowid
+        FROM tweets d
+        WHERE d.tweet_id = tweets.tweet_id
+        ORDER BY d.time_collected DESC, d.rowid DESC
+        LIMIT 1
+        );
+    """
+
+tweets_unique_index_sql = """
+    CREATE UNIQUE INDEX IF NOT EXISTS ix_tweets_tweet_id_unique ON tweets (tweet_id);
+    """
+
+upsert_sql = """
+    INSERT INTO {table} ({columns})
+    SELECT {columns} FROM {staging} WHERE true
+    ON CONFLICT ({key}) DO UPDATE SET {updates};
+    """
+
+# Schema migration - screen names are stored lowercase and collection dates are stored as columns
+# so the joins in tweets_sql and past_week_tweets_sql can use the indexes below
+add_column_sql = """
+    ALTER TABLE {table} ADD COLUMN {column} {column_type};
+    """
+
+# (table, column, column type) added to existing databases by migrate_schema
+migration_columns = [
+    ('tweets', 'collected_date', 'DATE'),
+    ('user_profile_log', 'collected_date', 'DATE'),
+    ('tweets', 'loaded_at', 'TIMESTAMP'),
+]
+
+migration_sql = [
+    """
+    UPDATE tweets SET loaded_at = time_collected WHERE loaded_at IS NULL;
+    """,
+    """
+    UPDATE tweets SET collected_date = DATE(time_collected) WHERE collected_date IS NULL;
+    """,
+    """
+    UPDATE user_profile_log SET collected_date = DATE(time_collected) WHERE collected_date IS NULL;
+    """,
+    """
+    UPDATE tweets SET twitter_screen_name = lower(twitter_screen_name)
+    WHERE twitter_screen_name <> lower(twitter_screen_name);
+    """,
+    """
+    UPDATE social SET twitter_screen_name = lower(twitter_screen_name)
+    WHERE twitter_screen_name <> lower(twitter_screen_name);
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS ix_tweets_screen_name_created_at ON tweets (twitter_screen_name, created_at);
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS ix_tweets_screen_name_collected_date ON tweets (twitter_screen_name, collected_date);
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS ix_tweets_created_at ON tweets (created_at);
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS ix_tweets_loaded_at ON tweets (loaded_at);
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS ix_user_profile_log_screen_name_collected_date
+        ON user_profile_log (screen_name, collected_date);
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS ix_social_twitter_screen_name ON social (twitter_screen_name);
+    """,
+]
+
+tweet_features_sql = """
+    SELECT * FROM tweet_features WHERE feature_version = :feature_version;
+    """
+
+stale_tweet_features_sql = """
+    DELETE FROM tweet_features WHERE feature_version <> :feature_version;
+    """
+
+# Remove duplicate stored features (overlapping or retried runs) before adding a unique index on tweet_id
+dedupe_tweet_features_postgres_sql = """
+    DELETE FROM tweet_features f
+    USING (
+        SELECT ctid,
+            row_number() OVER (PARTITION BY tweet_id) as row_num
+        FROM tweet_features
+        ) d
+    WHERE f.ctid = d.ctid
+        AND d.row_num > 1;
+    """
+
+dedupe_tweet_features_sql = """
+    DELETE FROM tweet_features
+    WHERE rowid NOT IN (SELECT max(rowid) FROM tweet_features GROUP BY tweet_id);
+    """
+
+tweet_features_unique_index_sql = """
+    CREATE UNIQUE INDEX IF NOT EXISTS ix_tweet_features_tweet_id_unique ON tweet_features (tweet_id);
+    """
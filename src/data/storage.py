@@ -0,0 +1,45 @@
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+def write_frame(df, path):
+    """
+    Write dataframe to a parquet file (the index is not stored)
+    :param df: Dataframe to write
+    :param path: File path, commonly ending in .parquet
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    pq.write_table(table, path)
+
+
+def read_frame(path, columns=None, memory_map=True):
+    """
+    Read dataframe from a parquet file, only loading the requested columns
+    :param path: File path to parquet file
+    :param columns: List of columns to read (defaults to all columns)
+    :param memory_map: Memory map the file instead of reading it into a buffer first
+    :return: pandas dataframe
+    """
+    return pq.read_table(path, columns=columns, memory_map=memory_map).to_pandas()
+
+
+def frame_columns(path):
+    """
+    List column names in a parquet file without reading any data
+    """
+    return pq.read_schema(path).names
+
+
+def save_matrix(array, path):
+    """
+    Save numeric array to a .npy file
+    """
+    np.save(path, np.asarray(array))
+
+
+def load_matrix(path, memory_map=True):
+    """
+    Load numeric array from a .npy file, memory mapped read-only by default so only the rows used are read from disk
+    """
+    return np.load(path, mmap_mode='r' if memory_map else None)
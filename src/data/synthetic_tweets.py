@@ -0,0 +1,194 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from src.data.db_functions import TWITTER_TIME_FORMAT
+
+
+WORDS = ['today', 'great', 'proud', 'families', 'jobs', 'tax', 'reform', 'healthcare', 'bill', 'vote', 'house',
+         'senate', 'congress', 'american', 'people', 'our', 'the', 'to', 'and', 'for', 'of', 'in', 'on', 'with',
+         'we', 'must', 'not', 'never', 'very', 'really', 'thank', 'you', 'happy', 'sad', 'bad', 'terrible',
+         'important', 'community', 'district', 'veterans', 'military', 'border', 'security', 'economy', 'small',
+         'business', 'workers', 'education', 'students', 'climate', 'energy', 'infrastructure', 'budget', 'deficit',
+         'constitution', 'rights', 'freedom', 'justice', 'immigration', 'opioid', 'crisis', 'funding', 'local',
+         'hearing', 'committee', 'meeting', 'town', 'hall', 'join', 'live', 'watch', 'read', 'statement', 'week']
+
+HASHTAGS = ['MAGA', 'TaxReform', 'ProtectOurCare', 'NetNeutrality', 'DACA', 'SOTU', 'GOPTaxScam', 'Resist',
+            'DrainTheSwamp', 'StandWithPP', 'OpioidCrisis', 'VeteransDay', 'ClimateChange', 'InfrastructureWeek']
+
+SOURCE_TIME = datetime(2017, 1, 1)
+
+
+def synthetic_users(n_accounts, seed=0):
+    """
+    Deterministic user profiles shaped like the 'user' object of tweets returned by the Twitter API
+    :param n_accounts: number of accounts
+    :param seed: random seed
+    :return: list of user dictionaries
+    """
+    rand = np.random.RandomState(seed)
+    followers = rand.lognormal(mean=10, sigma=1.2, size=n_accounts).astype(int)
+
+    users = []
+
+    for i in range(n_accounts):
+        screen_name = 'Rep{:04d}'.format(i)
+
+        users.append({'id': 1000000 + i,
+                      'id_str': str(1000000 + i),
+                      'name': 'Representative {}'.format(i),
+                      'screen_name': screen_name,
+                      'location': 'Washington, DC',
+                      'description': 'Proudly serving the people of district {}'.format(i),
+                      'followers_count': int(followers[i]),
+                      'friends_count': int(rand.randint(100, 5000)),
+                      'favourites_count': int(rand.randint(0, 10000)),
+                      'statuses_count': int(rand.randint(500, 20000)),
+                      'created_at': (SOURCE_TIME - timedelta(days=int(rand.randint(100, 3000)))).strftime(
+                          TWITTER_TIME_FORMAT),
+                      'time_zone': 'Eastern Time (US & Canada)',
+                      'profile_image_url': 'http://pbs.twimg.com/profile_images/{}/photo.jpg'.format(i),
+                      'profile_image_url_https': 'https://pbs.twimg.com/profile_images/{}/photo.jpg'.format(i)})
+
+    return users
+
+
+def synthetic_legislators(n_accounts, seed=0):
+    """
+    Deterministic legislator and social media frames for the synthetic users, shaped like the interim files
+    initial_data_gather writes from the congress-legislators YAML files
+    :param n_accounts: number of accounts
+    :param seed: random seed
+    :return: legislators dataframe and social dataframe
+    """
+    rand = np.random.RandomState(seed)
+    users = synthetic_users(n_accounts, seed=seed)
+    bioguide_ids = ['S{:06d}'.format(i) for i in range(n_accounts)]
+
+    legislators = pd.DataFrame({'id.bioguide': bioguide_ids,
+                                'bio.birthday': [(datetime(1940, 1, 1) + timedelta(days=int(days))).strftime('%Y-%m-%d')
+                                                 for days in rand.randint(0, 15000, n_accounts)],
+                                'bio.gender': rand.choice(['F', 'M'], n_accounts),
+                                'bio.religion': None,
+                                'name.first': ['Representative'] * n_accounts,
+                                'name.last': [str(i) for i in range(n_accounts)],
+                                'party': rand.choice(['Democrat', 'Republican'], n_accounts)},
+                               columns=['id.bioguide', 'bio.birthday', 'bio.gender', 'bio.religion',
+                                        'name.first', 'name.last', 'party'])
+
+    social = pd.DataFrame({'id.bioguide': bioguide_ids,
+                           'social.facebook': None,
+                           'social.twitter': [user['screen_name'] for user in users],
+                           'social.twitter_id': [float(user['id']) for user in users]},
+                          columns=['id.bioguide', 'social.facebook', 'social.twitter', 'social.twitter_id'])
+
+    return legislators, social
+
+
+def iter_synthetic_tweets(n_tweets, n_accounts=535, seed=0, start=SOURCE_TIME, days=365, batch_size=10000):
+    """
+    Generator of deterministic tweets shaped like the json TwAPI.fetch_user_timeline returns (extended tweet mode),
+    in order of creation. The same arguments always give the same tweets
+    :param n_tweets: number of tweets
+    :param n_accounts: number of accounts tweeting
+    :param seed: random seed
+    :param start: time of the first tweet
+    :param days: tweets are spread evenly over this many days
+    :param batch_size: number of tweets whose random draws are made at once
+    :return: yields tweet dictionaries
+    """
+    rand = np.random.RandomState(seed)
+    users = synthetic_users(n_accounts, seed=seed)
+    words = np.array(WORDS)
+    step = days * 24 * 3600 / max(n_tweets, 1)
+
+    for batch_start in range(0, n_tweets, batch_size):
+        n = min(batch_size, n_tweets - batch_start)
+
+        accounts = rand.randint(0, n_accounts, n)
+        n_words = rand.randint(5, 25, n)
+        n_hashtags = rand.choice(3, n, p=[.6, .3, .1])
+        n_mentions = rand.choice(3, n, p=[.7, .2, .1])
+        has_url = rand.rand(n) < .4
+        has_photo = rand.rand(n) < .3
+        shout = rand.rand(n) < .1
+        retweets = rand.negative_binomial(1, .01, n)
+        favorites = rand.negative_binomial(1, .003, n)
+
+        for j in range(n):
+            i = batch_start + j
+            user = users[accounts[j]]
+            tweet_words = list(words[rand.randint(0, len(words), n_words[j])])
+
+            if shout[j]:
+                tweet_words[0] = tweet_words[0].upper()
+
+            text = ' '.join(tweet_words).capitalize()
+            entities = {'hashtags': [], 'symbols': [], 'user_mentions': [], 'urls': []}
+
+            for tag in rand.choice(HASHTAGS, n_hashtags[j], replace=False):
+                text += ' '
+                entities['hashtags'].append({'text': tag, 'indices': [len(text), len(text) + len(tag) + 1]})
+                text += '#' + tag
+
+            for k in rand.randint(0, n_accounts, n_mentions[j]):
+                mention = users[k]
+                text += ' '
+                entities['user_mentions'].append({'screen_name': mention['screen_name'],
+                                                  'name': mention['name'],
+                                                  'id': mention['id'],
+                                                  'id_str': mention['id_str'],
+                                                  'indices': [len(text), len(text) + len(mention['screen_name']) + 1]})
+                text += '@' + mention['screen_name']
+
+            display_length = len(text)
+
+            if has_url[j]:
+                url = 'https://t.co/{:010d}'.format(i)
+                entities['urls'].append({'url': url, 'indices': [len(text) + 1, len(text) + 1 + len(url)]})
+                text += ' ' + url
+                display_length = len(text)
+
+            if has_photo[j]:
+                url = 'https://t.co/p{:09d}'.format(i)
+                entities['media'] = [{'type': 'photo', 'url': url, 'indices': [len(text) + 1, len(text) + 1 + len(url)],
+                                      'media_url_https': 'https://pbs.twimg.com/media/{}.jpg'.format(i)}]
+                text += ' ' + url
+
+            tweet_id = 800000000000000000 + i
+
+            yield {'created_at': (start + timedelta(seconds=i * step)).strftime(TWITTER_TIME_FORMAT),
+                   'id': tweet_id,
+                   'id_str': str(tweet_id),
+                   'full_text': text,
+                   'truncated': False,
+                   'display_text_range': [0, display_length],
+                   'entities': entities,
+                   'lang': 'en',
+                   'retweet_count': int(retweets[j]),
+                   'favorite_count': int(favorites[j]),
+                   'favorited': False,
+                   'retweeted': False,
+                   'user': user}
+
+
+def synthetic_tweets(n_tweets, n_accounts=535, seed=0, **kwargs):
+    """
+    List of deterministic tweets (see iter_synthetic_tweets)
+    """
+    return list(iter_synthetic_tweets(n_tweets, n_accounts=n_accounts, seed=seed, **kwargs))
+
+
+def synthetic_timelines(n_tweets, n_accounts=535, seed=0, **kwargs):
+    """
+    Deterministic tweets grouped into user timelines, newest tweet first like the Twitter API returns them
+    :return: dictionary of screen name to list of tweet dictionaries
+    """
+    timelines = {user['screen_name']: [] for user in synthetic_users(n_accounts, seed=seed)}
+
+    for tweet in iter_synthetic_tweets(n_tweets, n_accounts=n_accounts, seed=seed, **kwargs):
+        timelines[tweet['user']['screen_name']].append(tweet)
+
+    for timeline in timelines.values():
+        timeline.reverse()
+
+    return timelines
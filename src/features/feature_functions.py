@@ -1,15 +1,41 @@
-from src.data.sql_queries import tweets_sql
+from src.data.sql_queries import tweets_sql, tweet_text_sql
 import pandas as pd
+import numpy as np
+from scipy import sparse
 from src.data.db_functions import db_create_engine
-from textblob import TextBlob
-import re
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
+from src.features.text_normalizer import TweetNormalizer, URL_PUNCT_PATTERN
+from src.features.sentiment import LexiconSentiment
+from src.features.top_k import StreamingTopK
 import nltk
-from collections import Counter
+from itertools import chain, islice
 import pickle
 
-wordnet_lemma = WordNetLemmatizer()
+_normalizer = None
+_sentiment_scorer = None
+
+
+def get_normalizer():
+    """
+    Utility function to share one TweetNormalizer (stop words, lemma cache) across the process
+    """
+    global _normalizer
+
+    if _normalizer is None:
+        _normalizer = TweetNormalizer()
+
+    return _normalizer
+
+
+def get_sentiment_scorer():
+    """
+    Utility function to share one LexiconSentiment (compiled lexicon, score cache) across the process
+    """
+    global _sentiment_scorer
+
+    if _sentiment_scorer is None:
+        _sentiment_scorer = LexiconSentiment()
+
+    return _sentiment_scorer
 
 
 def fetch_all_tweets(config_file, conn_name):
@@ -32,60 +58,74 @@ def fetch_all_tweets(config_file, conn_name):
 def remove_urls_punct(tweet):
     """
     Utility function to clean tweet text by removing links, special characters
-    using simple regex statements.
+    using a single precompiled regex statement.
     """
-    # 1. Remove all urls
-    remove_urls = re.sub(r"http\S+", "", tweet)
-
-    # 2. Remove all punctuation
-    clean = re.sub(r'[^\w\s]', '', remove_urls)
-
-    return clean
+    return URL_PUNCT_PATTERN.sub('', tweet)
 
 
 def get_tweet_sentiment(tweet):
     """
     Utility function to classify sentiment of passed tweet
-    using textblob's sentiment method
+    using textblob's polarity lexicon
     """
-    analysis = TextBlob(remove_urls_punct(tweet))
-
-    if analysis.sentiment.polarity > 0:
-        return 1
-    elif analysis.sentiment.polarity == 0:
-        return 0
-    else:
-        return -1
+    return int(get_sentiment_scorer().score([tweet])[0])
 
 
-def find_rate_all_caps(tweet):
+def rate_all_caps(tweets):
     """
-    Takes in a tweet and returns the percentage of words in tweet that are all upper case
+    Takes in a column of tweets and returns the percentage of words in each tweet that are all upper case
+    (0 for missing tweets and tweets without words). Repeated tweets are only counted once
+    :param tweets: pandas series of tweet text
+    :return: numpy array of rates
     """
-    if len(tweet) == 0:
-        return 0
+    codes, unique_tweets = pd.factorize(tweets)
 
-    uppers = []
-    for word in tweet.split():
-        uppers.append(word.isupper())
+    words = [tweet.split() for tweet in unique_tweets]
+    n_words = np.array([len(tweet_words) for tweet_words in words], dtype=float)
+    n_upper = np.array([sum(map(str.isupper, tweet_words)) for tweet_words in words], dtype=float)
 
-    return sum(uppers)/len(uppers)
+    rates = np.divide(n_upper, n_words, out=np.zeros(len(words)), where=n_words > 0)
 
+    # factorize gives missing tweets code -1, which would index the last unique tweet's rate
+    return np.where(codes >= 0, rates[codes], 0.0)
 
-def generate_features(df):
+
+# Base features that only depend on the tweet itself (not on engagement counts that change over time)
+CONTENT_FEATURES = ['hour_created', 'weekday_created', 'photo_exists', 'tweet_sentiment', 'rate_all_caps']
+
+
+def generate_content_features(df):
     """
-    Takes in a dataframe of tweets and returns new dataframe of same length with feature columns in place of original
+    Adds feature columns that only depend on tweet content (time created, media and text) to dataframe
     :param df: Dataframe with tweet data, including columns for created_at, media_type and text
-    :return:
+    :return: Same dataframe with CONTENT_FEATURES columns added
     """
-    print('Generating base features...')
-    df['hour_created'] = [i.time().hour for i in df['created_at']]
-    df['weekday_created'] = [i.weekday() for i in df['created_at']]
-    df['photo_exists'] = [1 if 'photo' in media else 0 for media in df['media_type']]
-    df['tweet_sentiment'] = [get_tweet_sentiment(tweet) for tweet in df['text']]
-    df['retweets_per_followers'] = df['retweet_count']/df['user_followers']
-    df['favs_per_followers'] = df['favorite_count']/df['user_followers']
-    df['rate_all_caps'] = [find_rate_all_caps(i) for i in df['text']]
+    created_at = pd.to_datetime(df['created_at'])
+
+    df['hour_created'] = created_at.dt.hour.astype(np.int64)
+    df['weekday_created'] = created_at.dt.weekday.astype(np.int64)
+    # media_type is a list of media types from the api and its string form ('{photo}') from the database
+    df['photo_exists'] = df['media_type'].astype(str).str.contains('photo', regex=False).astype(np.int64)
+    df['tweet_sentiment'] = get_sentiment_scorer().score(df['text'])
+    df['rate_all_caps'] = rate_all_caps(df['text'])
+
+    return df
+
+
+def select_base_features(df):
+    """
+    Adds engagement ratio features and target to dataframe with content features and subsets the base feature columns
+    :param df: Dataframe with tweet data and CONTENT_FEATURES columns
+    :return: Dataframe with base feature columns
+    """
+    # Accounts without followers get 0 rather than inf/nan engagement ratios
+    followers = df['user_followers'].values.astype(float)
+    has_followers = followers > 0
+
+    df['retweets_per_followers'] = np.divide(df['retweet_count'].values, followers,
+                                             out=np.zeros(len(df)), where=has_followers)
+    df['favs_per_followers'] = np.divide(df['favorite_count'].values, followers,
+                                         out=np.zeros(len(df)), where=has_followers)
 
     try:
         df['target'] = df['party'].replace({'Republican': 1, 'Democrat': 0})
@@ -104,34 +144,63 @@ def generate_features(df):
     return df[base_cols]
 
 
-# Functions for quantifying most common hashtags and user mentions
-def all_elements(column):
+def generate_features(df):
     """
-    Takes a column containing a row-wise list of elements, removes any braces and splits each element
-    out into a list of total elements
+    Takes in a dataframe of tweets and returns new dataframe of same length with feature columns in place of original
+    :param df: Dataframe with tweet data, including columns for created_at, media_type and text
+    :return:
     """
-    elements_list = []
+    print('Generating base features...')
+    df = generate_content_features(df)
+
+    return select_base_features(df)
+
 
+# Functions for quantifying most common hashtags and user mentions
+def iter_elements(column):
+    """
+    Takes a column containing a row-wise list of elements, removes any braces and yields each element
+    """
     for row in column:
         clean = row.replace('{', '').replace('}', '')
 
         for element in clean.split(','):
             if element != '':
-                elements_list.append(element.lower())
+                yield element.lower()
+
+
+def all_elements(column):
+    """
+    Takes a column containing a row-wise list of elements, removes any braces and splits each element
+    out into a list of total elements
+    """
+    return list(iter_elements(column))
+
 
-    return elements_list
+def iter_row_batches(rows, batch_size):
+    """
+    Split an iterable of rows (eg. tokenized tweets) into lists of at most batch_size rows
+    """
+    rows = iter(rows)
+
+    while True:
+        batch = list(islice(rows, batch_size))
 
+        if not batch:
+            return
 
-def find_most_common_elements(column, top_x):
+        yield batch
+
+
+def find_most_common_elements(column, top_x, capacity=None, batch_size=10000):
     """
     Takes in list of elements and returns the top x most common
+    :param capacity: max number of distinct elements to keep counts for (None counts exactly)
+    :param batch_size: number of rows counted at a time (bounds memory when capacity is set)
     """
-    exploded_list = all_elements(column)
-    count_elements = Counter(exploded_list)
-
-    top_features = [i[0] for i in list(count_elements.most_common(top_x))]
+    batches = (iter_elements(batch) for batch in iter_row_batches(column, batch_size))
 
-    return top_features
+    return StreamingTopK(capacity=capacity).update_batches(batches).top(top_x)
 
 
 # Functions for cleaning and tokenizing raw tweet text
@@ -144,23 +213,8 @@ def clean_tweets(tweets):
     """
     cleaned_tweets = []
 
-    for i in tweets:
-
-        # 1. Remove all urls and punctuation
-        clean = remove_urls_punct(i)
-
-        # 2. Convert to string
-        uni = [str(i) for i in clean.lower().split()]
-
-        # 3. Remove english stop words
-        stops = set(stopwords.words("english") + ['amp'])
-        meaningful_words = [w for w in uni if not w in stops]
-
-        # 4. Create lemmas for meaningful words
-        lemmas = [wordnet_lemma.lemmatize(i) for i in meaningful_words]
-
-        cleaned_tw = " ".join( lemmas )
-        cleaned_tweets.append(cleaned_tw)
+    for batch in get_normalizer().clean_batches(tweets):
+        cleaned_tweets.extend(batch)
 
     return cleaned_tweets
 
@@ -173,31 +227,47 @@ def tokenize_tweets(tweets):
     """
     tweet_tokens = []
 
-    for i in clean_tweets(tweets):
-
-        tokens = nltk.word_tokenize(i, "english")
-        tweet_tokens.append(tokens)
+    for batch in get_normalizer().tokenize_batches(tweets):
+        tweet_tokens.extend(batch)
 
     return tweet_tokens
 
 
-def find_top_used_words(tokenized_text, top_x):
+def find_top_used_words(tokenized_text, top_x, capacity=None, batch_size=10000):
     """
     Finds top most commonly used words in corpus of text
-    :param training_text: List of tweets from training set
+    :param tokenized_text: Iterable of tokenized tweets from training set
     :param top_x: Integer to indicate top X words from training corpus
+    :param capacity: max number of distinct words to keep counts for (None counts exactly)
+    :param batch_size: number of tweets counted at a time (bounds memory when capacity is set)
     :return: Feature set for most common words in training set
     """
-    all_words = []
+    batches = (chain.from_iterable(batch) for batch in iter_row_batches(tokenized_text, batch_size))
 
-    for tweet in tokenized_text:
-        for w in tweet:
-            all_words.append(w)
+    return StreamingTopK(capacity=capacity).update_batches(batches).top(top_x)
+
+
+def find_top_used_words_db(engine, top_x, chunk_size=50000, capacity=None):
+    """
+    Finds top most commonly used words in all tweets, reading and tokenizing tweet text from the database in chunks
+    so that the whole corpus is never in memory at once
+    :param engine: sqlAlchemy engine connected to database
+    :param top_x: Integer to indicate top X words
+    :param chunk_size: number of tweets read and tokenized at once
+    :param capacity: max number of distinct words to keep counts for (None counts exactly)
+    :return: Feature set for most common words in all tweets
+    """
+    top_words = StreamingTopK(capacity=capacity)
 
-    word_counts = nltk.FreqDist(all_words)
-    word_features = [i[0] for i in list(word_counts.most_common(top_x))]
+    # stream_results uses a server side cursor, so rows are only fetched a chunk at a time
+    with engine.connect().execution_options(stream_results=True) as connection:
+        for i, chunk in enumerate(pd.read_sql_query(tweet_text_sql, con=connection, chunksize=chunk_size)):
+            for batch in get_normalizer().tokenize_batches(chunk['text'], batch_size=chunk_size):
+                top_words.update(chain.from_iterable(batch))
 
-    return word_features
+            print('Counted words in {} tweets'.format(i * chunk_size + len(chunk)))
+
+    return top_words.top(top_x)
 
 
 def find_text_features(tweet, feature_set):
@@ -214,16 +284,74 @@ def find_text_features(tweet, feature_set):
     return features
 
 
-def generate_common_word_features(text_data, pickle_new_features=False, word_feature_filename='all_word_features'):
+def build_word_index(word_feature_set):
+    """
+    Precompile word features into a lookup from each word to its column in the text feature matrix. Columns are
+    in alphabetical order, the column order of the word feature dataframes the text model was trained on
+    :param word_feature_set: List of top words used in corpus of training text
+    :return: Dictionary mapping word to column index
+    """
+    return {word: column for column, word in enumerate(sorted(set(word_feature_set)))}
+
+
+def tokens_to_sparse(tokenized_text, word_index):
+    """
+    Utility function to indicate which word features appear in each tweet in a single pass over the tokens
+    :param tokenized_text: List of tokenized tweets
+    :param word_index: Dictionary mapping word feature to column index (see build_word_index)
+    :return: Sparse boolean CSR matrix with one row per tweet and one column per word feature
+    """
+    indptr = [0]
+    indices = []
+
+    for tweet in tokenized_text:
+        columns = {word_index[w] for w in tweet if w in word_index}
+        indices.extend(sorted(columns))
+        indptr.append(len(indices))
+
+    data = np.ones(len(indices), dtype=bool)
+
+    return sparse.csr_matrix((data, indices, indptr), shape=(len(indptr) - 1, len(word_index)))
+
+
+def generate_common_word_features(text_data, pickle_new_features=False, word_feature_filename='all_word_features',
+                                  word_index=None):
     """
     Utility function to tokenize text data, find top words in a corpus of text and pickle them as word features
+    :param word_index: Already loaded word index (see build_word_index) to use instead of reading the pickled
+    word features from disk
+    :return: Sparse boolean CSR matrix of word features, columns in alphabetical order (see build_word_index)
     """
     clean_features = tokenize_tweets(text_data)
 
+    return generate_token_word_features(clean_features, pickle_new_features=pickle_new_features,
+                                        word_feature_filename=word_feature_filename, word_index=word_index)
+
+
+def load_word_index(path):
+    """
+    Utility function to read pickled word features and build the word index
+    """
+    with open(path, 'rb') as features:
+        return build_word_index(pickle.load(features))
+
+
+def generate_token_word_features(clean_features, pickle_new_features=False, word_feature_filename='all_word_features',
+                                 word_index=None, capacity=None):
+    """
+    Utility function to find top words in a corpus of already tokenized text and pickle them as word features
+    :param word_index: Already loaded word index (see build_word_index) to use instead of reading the pickled
+    word features from disk
+    :param capacity: max number of distinct words to keep counts for when finding top words (None counts exactly)
+    :return: Sparse boolean CSR matrix of word features, columns in alphabetical order (see build_word_index)
+    """
+    if word_index is not None:
+        return tokens_to_sparse(clean_features, word_index=word_index)
+
     if pickle_new_features:
 
         print('Pickling word features to {}.pkl for future use'.format(word_feature_filename))
-        word_feature_set = find_top_used_words(tokenized_text=clean_features, top_x=1750)
+        word_feature_set = find_top_used_words(tokenized_text=clean_features, top_x=1750, capacity=capacity)
 
         with open('data/processed/{}.pkl'.format(word_feature_filename), 'wb') as wf:
             pickle.dump(word_feature_set, wf)
@@ -232,10 +360,7 @@ def generate_common_word_features(text_data, pickle_new_features=False, word_fea
         with open('data/processed/{}.pkl'.format(word_feature_filename), 'rb') as features:
             word_feature_set = pickle.load(features)
 
-    feature_set = [(find_text_features(tweet, feature_set=word_feature_set))
-                   for (tweet) in clean_features]
-
-    return pd.DataFrame(feature_set)
+    return tokens_to_sparse(clean_features, word_index=build_word_index(word_feature_set))
 
 
 def print_most_important_features(train_set, test_set):
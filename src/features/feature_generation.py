@@ -1,69 +1,164 @@
 from src.features import feature_functions as feat_funcs
+from src.features import parallel_features as par_funcs
+from src.features import feature_store as store_funcs
+from src.data.db_functions import db_create_engine
+from src.data.storage import write_frame, save_matrix
+from src.instrumentation import RunMetrics
 from sklearn.model_selection import train_test_split
+from scipy import sparse
+import pandas as pd
+import pickle
 from flask import Flask
+import click
 
 
 app = Flask(__name__)
 
 
 @app.cli.command()
-def pickle_all_features():
+@click.option('--workers', default=1, type=click.IntRange(min=0),
+              help='Number of worker processes (1 runs serially, 0 uses all cores)')
+@click.option('--chunk-size', default=10000, type=click.IntRange(min=1),
+              help='Number of tweets per chunk sent to each worker')
+@click.option('--feature-store/--no-feature-store', default=False,
+              help='Only compute base features for tweets missing from the tweet_features table')
+@click.option('--vocab-capacity', default=0,
+              help='Max distinct words counted when finding top words (0 counts exactly)')
+@click.option('--trace-memory', is_flag=True, help='Record peak memory of each stage in the run metrics')
+def pickle_all_features(workers, chunk_size, feature_store, vocab_capacity, trace_memory):
     """
     Generate new features from all available data
     """
-    all_tweets = feat_funcs.fetch_all_tweets(config_file='config.ini',
-                                             conn_name='PostgresConfig')
+    metrics = RunMetrics('pickle_all_features', trace_memory=trace_memory)
+
+    with metrics.stage('fetch'):
+        all_tweets = feat_funcs.fetch_all_tweets(config_file='config.ini',
+                                                 conn_name='PostgresConfig')
+    metrics.count('fetch', len(all_tweets))
+
+    if feature_store:
+        engine = db_create_engine(config_file='config.ini', conn_name='PostgresConfig')
+
+        with metrics.stage('feature', rows=len(all_tweets)):
+            base_features = store_funcs.generate_features_incremental(all_tweets, engine=engine)
+
+        with metrics.stage('normalize', rows=len(all_tweets)):
+            if workers == 1:
+                tokens = feat_funcs.tokenize_tweets(all_tweets['text'])
+            else:
+                tokens = list(par_funcs.tokenize_tweets_parallel(all_tweets['text'],
+                                                                 n_workers=workers or None,
+                                                                 chunk_size=chunk_size))
+    elif workers == 1:
+        with metrics.stage('feature', rows=len(all_tweets)):
+            base_features = feat_funcs.generate_features(all_tweets)
+
+        with metrics.stage('normalize', rows=len(all_tweets)):
+            tokens = feat_funcs.tokenize_tweets(all_tweets['text'])
+    else:
+        # Workers tokenize and generate base features in the same pass
+        with metrics.stage('feature', rows=len(all_tweets)):
+            base_features, tokens = par_funcs.generate_features_parallel(all_tweets,
+                                                                         n_workers=workers or None,
+                                                                         chunk_size=chunk_size)
+
+    # Save base features for model on meta data
+    with metrics.stage('save', rows=len(base_features)):
+        write_frame(base_features, 'data/processed/base_features.parquet')
+
+    # Create sparse features for top 1750 most common words
+    with metrics.stage('text_feature', rows=len(tokens)):
+        text_features = feat_funcs.generate_token_word_features(tokens,
+                                                                pickle_new_features=True,
+                                                                word_feature_filename='all_word_features',
+                                                                capacity=vocab_capacity or None)
+
+    with metrics.stage('save'):
+        sparse.save_npz('data/processed/all_text_features.npz', text_features)
+
+        save_matrix(base_features['target'], 'data/processed/all_target.npy')
+
+    metrics.write()
 
-    # Pickle base features for model on meta data
-    base_features = feat_funcs.generate_features(all_tweets)
-    base_features.to_pickle('data/processed/base_features.pkl')
 
-    # Pickle text features for future predictions
-    tweet_text = all_tweets['text']
+@app.cli.command()
+@click.option('--top', default=1750, help='Number of most common words to keep as word features')
+@click.option('--chunk-size', default=50000, help='Number of tweets read from the database at once')
+@click.option('--capacity', default=0, help='Max distinct words counted (0 counts exactly)')
+@click.option('--word-feature-filename', default='db_word_features',
+              help='Name of pickle file in data/processed (all_word_features is the served vocabulary and is '
+                   'only written by pickle_all_features)')
+def pickle_word_features(top, chunk_size, capacity, word_feature_filename):
+    """
+    Find most common words in all tweets without loading all tweets at once, and pickle them as word features
+    """
+    if word_feature_filename == 'all_word_features':
+        raise click.BadParameter('all_word_features must match the trained text model, '
+                                 'regenerate it with pickle_all_features', param_hint='--word-feature-filename')
 
-    # Create features for top 1750 most common words
-    text_features = feat_funcs.generate_common_word_features(tweet_text,
-                                                             pickle_new_features=True,
-                                                             word_feature_filename='all_word_features')
+    engine = db_create_engine(config_file='config.ini', conn_name='PostgresConfig')
 
-    text_features.to_pickle('data/processed/all_text_features.pkl')
+    word_feature_set = feat_funcs.find_top_used_words_db(engine, top_x=top, chunk_size=chunk_size,
+                                                         capacity=capacity or None)
 
-    target = base_features['target']
-    target.to_pickle('data/processed/all_target.pkl')
+    print('Pickling word features to {}.pkl for future use'.format(word_feature_filename))
+    with open('data/processed/{}.pkl'.format(word_feature_filename), 'wb') as wf:
+        pickle.dump(word_feature_set, wf)
 
 
 @app.cli.command()
-def pickle_train_test_features():
+@click.option('--workers', default=1, type=click.IntRange(min=0),
+              help='Number of worker processes (1 runs serially, 0 uses all cores)')
+@click.option('--chunk-size', default=10000, type=click.IntRange(min=1),
+              help='Number of tweets per chunk sent to each worker')
+@click.option('--trace-memory', is_flag=True, help='Record peak memory of each stage in the run metrics')
+def pickle_train_test_features(workers, chunk_size, trace_memory):
     """
     Generate new text features for model evaluation
     """
-    all_tweets = feat_funcs.fetch_all_tweets(config_file='config.ini',
-                                             conn_name='PostgresConfig')
+    metrics = RunMetrics('pickle_train_test_features', trace_memory=trace_memory)
+
+    with metrics.stage('fetch'):
+        all_tweets = feat_funcs.fetch_all_tweets(config_file='config.ini',
+                                                 conn_name='PostgresConfig')
+    metrics.count('fetch', len(all_tweets))
 
     all_tweets['target'] = all_tweets['party'].replace({'Republican': 1, 'Democrat': 0})
 
-    # Pickle text features
+    # Clean and tokenize words before splitting (the split only depends on row count and seed)
     target = all_tweets['target']
-    features = all_tweets['text']
+
+    with metrics.stage('normalize', rows=len(all_tweets)):
+        if workers == 1:
+            features = pd.Series(feat_funcs.tokenize_tweets(all_tweets['text']), index=all_tweets.index)
+        else:
+            features = par_funcs.tokenize_tweets_parallel(all_tweets['text'],
+                                                          n_workers=workers or None,
+                                                          chunk_size=chunk_size)
 
     x_train, x_test, y_train, y_test = train_test_split(features, target,
                                                         test_size=.2,
                                                         random_state=42)
 
-    # Clean and tokenize words in train and test set before identifying feature set
-    train_features = feat_funcs.generate_common_word_features(x_train,
-                                                              pickle_new_features=True,
-                                                              word_feature_filename='train_word_features')
+    # Identify feature set on train set only
+    with metrics.stage('text_feature', rows=len(features)):
+        train_features = feat_funcs.generate_token_word_features(list(x_train),
+                                                                 pickle_new_features=True,
+                                                                 word_feature_filename='train_word_features')
+
+        test_features = feat_funcs.generate_token_word_features(list(x_test),
+                                                                pickle_new_features=False,
+                                                                word_feature_filename='train_word_features')
 
-    test_features = feat_funcs.generate_common_word_features(x_test,
-                                                             pickle_new_features=False,
-                                                             word_feature_filename='train_word_features')
+    # Sparse matrices are saved separately from their targets (rows line up with target order)
+    with metrics.stage('save', rows=len(features)):
+        sparse.save_npz('data/processed/train_text_features.npz', train_features)
+        sparse.save_npz('data/processed/test_text_features.npz', test_features)
 
-    train_features['target'] = list(y_train)
-    test_features['target'] = list(y_test)
+        save_matrix(y_train, 'data/processed/train_text_target.npy')
+        save_matrix(y_test, 'data/processed/test_text_target.npy')
 
-    train_features.to_pickle('data/processed/train_text_features.pkl')
-    test_features.to_pickle('data/processed/test_text_features.pkl')
+    metrics.write()
 
 
 if __name__ == '__main__':
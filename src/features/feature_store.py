@@ -0,0 +1,105 @@
+import hashlib
+import inspect
+import pandas as pd
+from sqlalchemy import text, inspect as inspect_db
+from src.data.db_functions import bulk_load_df, upsert_df
+from src.data.sql_queries import tweet_features_sql, stale_tweet_features_sql, dedupe_tweet_features_postgres_sql, \
+    dedupe_tweet_features_sql, tweet_features_unique_index_sql
+from src.features import feature_functions as feat_funcs
+from src.features import sentiment, text_normalizer
+
+
+def feature_version():
+    """
+    Fingerprint of the code behind the stored features - changes whenever any of it is edited
+    """
+    sources = [inspect.getsource(func) for func in [feat_funcs.generate_content_features,
+                                                     feat_funcs.get_tweet_sentiment,
+                                                     feat_funcs.rate_all_caps,
+                                                     feat_funcs.remove_urls_punct]]
+    sources.append(inspect.getsource(sentiment.LexiconSentiment))
+    sources.append(text_normalizer.URL_PUNCT_PATTERN.pattern)
+    sources.append(','.join(feat_funcs.CONTENT_FEATURES))
+
+    return hashlib.sha1('\n'.join(sources).encode('utf-8')).hexdigest()[:12]
+
+
+def ensure_unique_tweet_features(engine):
+    """
+    Remove duplicate stored features and add a unique index on tweet_id, so features can be upserted.
+    Does nothing if the unique index already exists
+    """
+    if any(index['name'] == 'ix_tweet_features_tweet_id_unique'
+           for index in inspect_db(engine).get_indexes('tweet_features')):
+        return
+
+    print('Removing duplicate stored features and adding unique index on tweet_id')
+    with engine.begin() as connection:
+        if engine.dialect.name == 'postgresql':
+            connection.execute(dedupe_tweet_features_postgres_sql)
+        else:
+            connection.execute(dedupe_tweet_features_sql)
+
+        connection.execute(tweet_features_unique_index_sql)
+
+
+def load_feature_store(engine, version=None):
+    """
+    Read stored content features for the current feature version, dropping rows computed by older feature code
+    :param engine: sqlAlchemy engine connected to database
+    :param version: feature version to read (defaults to the current code's version)
+    :return: Dataframe of CONTENT_FEATURES indexed by tweet_id
+    """
+    version = version or feature_version()
+
+    if not engine.has_table('tweet_features'):
+        return pd.DataFrame(columns=feat_funcs.CONTENT_FEATURES, index=pd.Index([], name='tweet_id'))
+
+    with engine.begin() as connection:
+        deleted = connection.execute(text(stale_tweet_features_sql), {'feature_version': version}).rowcount
+
+    if deleted > 0:
+        print('Removed {} stored features from older feature versions'.format(deleted))
+
+    stored = pd.read_sql_query(sql=text(tweet_features_sql), con=engine, params={'feature_version': version})
+    stored = stored.drop_duplicates(subset=['tweet_id'], keep='last')
+
+    return stored.set_index('tweet_id')[feat_funcs.CONTENT_FEATURES]
+
+
+def generate_features_incremental(df, engine):
+    """
+    Same output as generate_features, but content features are only computed for tweets missing from the
+    tweet_features table and read from the table for everything else. New features are written back to the table
+    :param df: Dataframe with tweet data, including columns for tweet_id, created_at, media_type and text
+    :param engine: sqlAlchemy engine connected to database
+    :return: Dataframe with base feature columns
+    """
+    version = feature_version()
+    stored = load_feature_store(engine, version=version)
+
+    missing = df[~df['tweet_id'].isin(stored.index)].drop_duplicates(subset=['tweet_id'])
+    print('{} of {} tweets found in feature store (version {})'.format(len(df) - len(missing), len(df), version))
+
+    if len(missing) > 0:
+        print('Generating base features for {} new tweets...'.format(len(missing)))
+        new_features = feat_funcs.generate_content_features(missing.copy())
+        new_features = new_features[['tweet_id'] + feat_funcs.CONTENT_FEATURES].reset_index(drop=True)
+        new_features['feature_version'] = version
+
+        # Upserted once the table exists, so overlapping or retried runs never store a tweet twice
+        if not engine.has_table('tweet_features'):
+            bulk_load_df(new_features, table_name='tweet_features', engine=engine, if_exists='append')
+            ensure_unique_tweet_features(engine)
+        else:
+            ensure_unique_tweet_features(engine)
+            upsert_df(new_features, table_name='tweet_features', engine=engine, key='tweet_id',
+                      update_columns=feat_funcs.CONTENT_FEATURES + ['feature_version'])
+        stored = pd.concat([stored, new_features.set_index('tweet_id')[feat_funcs.CONTENT_FEATURES]])
+
+    content = stored.loc[df['tweet_id'], feat_funcs.CONTENT_FEATURES]
+
+    for col in feat_funcs.CONTENT_FEATURES:
+        df[col] = pd.to_numeric(content[col].values)
+
+    return feat_funcs.select_base_features(df)
@@ -1,6 +1,5 @@
-from src.data.db_functions import TwAPI, create_dataframes_from_tweet_json
+from src.data.db_functions import get_twitter_client, create_dataframes_from_tweet_json
 from src.features.feature_functions import generate_features, generate_common_word_features
-from configparser import ConfigParser
 from tweepy.error import TweepError
 import pandas as pd
 import numpy as np
@@ -24,34 +23,61 @@ def extract_twitter_id(url):
         print('Please submit valid Twitter URL for particular tweet (longform url, not bitly)')
 
 
-def fetch_tweet_info(url):
+def parse_tweet_ids(urls_or_ids):
+    """
+    Function to extract tweet IDs from a list of tweet URLs and/or bare tweet IDs
+    :param urls_or_ids: List of tweet URLs or tweet IDs
+    :return: list of tweet IDs (None where the input could not be parsed)
+    """
+    tweet_ids = []
+
+    for item in urls_or_ids:
+        item = str(item).strip()
+
+        if item.isdigit():
+            tweet_ids.append(item)
+        else:
+            tweet_ids.append(extract_twitter_id(item))
+
+    return tweet_ids
+
+
+def fetch_tweet_info(url, timeout=None):
     """
     Fetch tweet info for feature generation and display data from given url
     :param url: Url input from form
+    :param timeout: seconds to wait for the Twitter API (None waits indefinitely)
     :return: dataframe with tweet data for feature generation and list of display data
     """
     tweet_id = extract_twitter_id(url)
-
-    config = ConfigParser()
-    config.read('config.ini')
-
-    api = TwAPI(consumer_key=config.get('TwitterKeys', 'consumer_key'),
-                consumer_secret=config.get('TwitterKeys', 'consumer_secret'),
-                access_token=config.get('TwitterKeys', 'access_token'),
-                access_token_secret=config.get('TwitterKeys', 'access_token_secret'))
+    api = get_twitter_client()
 
     try:
-        tweet = api.api.get_status('{}'.format(tweet_id), tweet_mode="extended")
+        tweet = api.get_status('{}'.format(tweet_id), timeout=timeout)
     except TweepError as e:
         raise(e)
 
-    return tweet._json
+    return tweet
+
+
+def fetch_tweets_info(tweet_ids):
+    """
+    Fetch tweet info for a batch of tweet IDs using bulk status lookups
+    :param tweet_ids: List of tweet IDs
+    :return: dictionary of tweet json keyed by tweet ID (missing tweets are left out)
+    """
+    api = get_twitter_client()
+    tweets = api.lookup_statuses(tweet_ids)
+
+    return {tweet['id_str']: tweet for tweet in tweets}
 
 
-def generate_tweet_features(tweet_json):
+def generate_tweet_features(tweet_json, word_index=None):
     """
     Function to generate base features for prediction on non-text features
     :param tweet_json: json with tweet info
+    :param word_index: vocabulary of the text model the features are for (defaults to reading the pickled
+    all_word_features)
     :return: feature array for prediction and dictionary with tweet display info
     """
 
@@ -70,6 +96,33 @@ def generate_tweet_features(tweet_json):
                              'full_text': 'text'}, inplace=True)
 
     base_features = generate_features(df=tweet_df)
-    text_features = generate_common_word_features(text_data=[tweet_text])
+    text_features = generate_common_word_features(text_data=[tweet_text], word_index=word_index)
+
+    return np.array(base_features), text_features, display_info
+
+
+def generate_batch_tweet_features(tweet_jsons, word_index=None):
+    """
+    Function to generate base and text features for a batch of tweets in one pass
+    :param tweet_jsons: list of json with tweet info
+    :param word_index: vocabulary of the text model the features are for (defaults to reading the pickled
+    all_word_features)
+    :return: base feature matrix, text feature matrix (one row per tweet, in input order)
+    and list of dictionaries with tweet display info
+    """
+    display_info = [{'name': tweet['user']['name'],
+                     'profile_image': tweet['user']['profile_image_url_https'],
+                     'tweet_text': tweet['full_text']} for tweet in tweet_jsons]
+
+    _, tweet_df = create_dataframes_from_tweet_json(tweet_jsons)
+
+    tweet_df['user_followers'] = [tweet['user']['followers_count'] for tweet in tweet_jsons]
+    tweet_df['created_at'] = pd.to_datetime(tweet_df['created_at'])
+    tweet_df.rename(columns={'id': 'tweet_id',
+                             'user.screen_name': 'twitter_screen_name',
+                             'full_text': 'text'}, inplace=True)
+
+    base_features = generate_features(df=tweet_df)
+    text_features = generate_common_word_features(text_data=list(tweet_df['text']), word_index=word_index)
 
     return np.array(base_features), text_features, display_info
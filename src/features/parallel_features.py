@@ -0,0 +1,67 @@
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from src.features import feature_functions as feat_funcs
+
+
+def split_chunks(df, chunk_size):
+    """
+    Split dataframe (or series) into consecutive chunks of at most chunk_size rows
+    """
+    return [df.iloc[start:start + chunk_size] for start in range(0, len(df), chunk_size)]
+
+
+def _base_and_tokens(chunk):
+    """
+    Worker function - sentiment, caps rate and other base features plus tokenized text for one chunk
+    """
+    base_features = feat_funcs.generate_features(chunk.copy())
+    tokens = feat_funcs.tokenize_tweets(chunk['text'])
+
+    return base_features, tokens
+
+
+def _tokens(chunk):
+    """
+    Worker function - tokenized text for one chunk
+    """
+    return feat_funcs.tokenize_tweets(chunk)
+
+
+def generate_features_parallel(df, n_workers=None, chunk_size=10000):
+    """
+    Generate base features and tokenize tweet text across a pool of processes
+    :param df: Dataframe with tweet data (see generate_features)
+    :param n_workers: Number of worker processes (None to use all cores)
+    :param chunk_size: Number of tweets sent to a worker at a time
+    :return: base features dataframe and list of tokenized tweets, both in the original row order
+    """
+    if len(df) == 0:
+        return pd.DataFrame(), []
+
+    print('Generating features with {} workers in chunks of {}...'.format(n_workers or 'all', chunk_size))
+
+    # executor.map returns results in the order chunks were submitted
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        results = list(executor.map(_base_and_tokens, split_chunks(df, chunk_size)))
+
+    base_features = pd.concat([base for base, _ in results])
+    tokens = [tweet for _, chunk_tokens in results for tweet in chunk_tokens]
+
+    return base_features, tokens
+
+
+def tokenize_tweets_parallel(text_data, n_workers=None, chunk_size=10000):
+    """
+    Clean and tokenize tweet text across a pool of processes
+    :param text_data: Series of raw tweet text
+    :param n_workers: Number of worker processes (None to use all cores)
+    :param chunk_size: Number of tweets sent to a worker at a time
+    :return: Series of tokenized tweets with the same index as text_data
+    """
+    if len(text_data) == 0:
+        return pd.Series([], index=text_data.index, dtype=object)
+
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        results = list(executor.map(_tokens, split_chunks(text_data, chunk_size)))
+
+    return pd.Series([tweet for chunk_tokens in results for tweet in chunk_tokens], index=text_data.index)
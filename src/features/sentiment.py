@@ -0,0 +1,169 @@
+from itertools import chain, repeat
+import numpy as np
+from textblob import TextBlob
+from textblob.en import sentiment as pattern_sentiment
+from textblob._text import EMOTICONS
+from src.features.text_normalizer import URL_PUNCT_PATTERN
+
+
+class LexiconSentiment:
+
+    def __init__(self, cache_size=100000):
+        """
+        Initialize sentiment scorer - textblob's polarity lexicon is compiled once into arrays indexed by word id.
+        Scores are the same as textblob's pattern analyzer on tweets with urls and punctuation removed
+        :param cache_size: max number of distinct tweets to keep scores for across calls
+        """
+        # textblob loads its lexicon lazily on first lookup
+        'good' in pattern_sentiment
+        lexicon = dict(dict.items(pattern_sentiment))
+
+        self.word_ids = {word: i for i, word in enumerate(lexicon)}
+        self.polarity = np.array([lexicon[word][None][0] for word in lexicon])
+        self.intensity = np.array([lexicon[word][None][2] for word in lexicon])
+        self.is_modifier = np.array([any(pos in lexicon[word] for pos in pattern_sentiment.modifiers)
+                                     for word in lexicon])
+        self.negations = frozenset(pattern_sentiment.negations)
+        self.modifier = pattern_sentiment.modifier
+
+        # Emoticons made only of word characters survive punctuation removal (eg. 'o_O')
+        self.emoticons = {e.lower(): p for (_, p), emoticons in EMOTICONS.items() for e in emoticons
+                          if URL_PUNCT_PATTERN.sub('', e) == e and not e.isalpha() and len(e) <= 5}
+
+        # Per word (polarity, intensity, is modifier) for scoring tweets word by word
+        self.entries = {word: (p, i, m) for word, p, i, m in zip(lexicon, self.polarity.tolist(),
+                                                                  self.intensity.tolist(), self.is_modifier)}
+        # Tweets containing any of these words can't be scored as a plain average of word polarities
+        self.special_words = frozenset(w for w, m in zip(lexicon, self.is_modifier) if m) | self.negations | \
+            frozenset(self.emoticons)
+
+        self.cache = {}
+        self.cache_size = cache_size
+
+    @staticmethod
+    def tokenize(tweet):
+        """
+        Split tweet into lowercase words the way textblob's tokenizer does once urls and punctuation are removed
+        (underscores are the only remaining characters it splits off, and they carry no sentiment)
+        """
+        text = URL_PUNCT_PATTERN.sub('', tweet).lower()
+
+        if '_' not in text:
+            return text.split()
+
+        return [w for w in (word.strip('_') for word in text.split()) if w]
+
+    def polarity_of_tokens(self, words):
+        """
+        Average polarity of tokenized tweet, following textblob's handling of modifiers ("very good") and
+        negations ("not good")
+        """
+        assessments = []
+        m = None
+        n = None
+
+        for w in words:
+            entry = self.entries.get(w)
+
+            if entry is not None:
+                polarity, intensity, is_modifier = entry
+
+                if m is None:
+                    assessments.append([polarity, intensity, 1])
+                else:
+                    assessments[-1][0] = max(-1.0, min(polarity * assessments[-1][1], 1.0))
+                    assessments[-1][1] = intensity
+
+                if n is not None:
+                    assessments[-1][1] = 1.0 / assessments[-1][1]
+                    assessments[-1][2] = -1
+
+                m = w if is_modifier else None
+                n = w if w in self.negations else None
+            else:
+                if w in self.negations:
+                    n = w
+                elif n and len(w.strip("'")) > 1:
+                    n = None
+
+                if n is not None and m is not None and self.modifier(m):
+                    assessments[-1][2] = -1
+                    n = None
+                elif m and len(w) > 2:
+                    m = None
+
+                if w in self.emoticons:
+                    assessments.append([self.emoticons[w], 1.0, 1])
+
+        if not assessments:
+            return 0.0
+
+        total = 0
+        for p, _, negated in assessments:
+            total += p * -0.5 if negated < 0 else p
+
+        return total / len(assessments)
+
+    def score(self, tweets):
+        """
+        Classify sentiment of a column of tweets as 1 (positive), 0 (neutral) or -1 (negative).
+        Tweets without modifiers, negations or emoticons are scored together with array operations, the rest
+        word by word. Repeated tweets are only scored once
+        :param tweets: iterable of raw tweet text
+        :return: numpy array of sentiment classes
+        """
+        tweets = list(tweets)
+
+        # The scorer is shared across threads: entries are never removed from a cache dictionary (a full cache is
+        # replaced by a new one), so this reference keeps every score checked below
+        cache = self.cache
+        unique = [tweet for tweet in dict.fromkeys(tweets) if tweet not in cache]
+
+        tokenized = [self.tokenize(tweet) for tweet in unique]
+        special = [i for i, words in enumerate(tokenized) if not self.special_words.isdisjoint(words)]
+
+        # Fast path: polarity is the mean of the lexicon polarity of each known word
+        token_ids = np.fromiter(map(self.word_ids.get, chain.from_iterable(tokenized), repeat(-1)),
+                                dtype=np.int64)
+        rows = np.repeat(np.arange(len(unique)), [len(words) for words in tokenized])
+        known = token_ids >= 0
+        totals = np.bincount(rows[known], weights=self.polarity[token_ids[known]], minlength=len(unique))
+        scores = np.sign(totals).astype(int)
+
+        for i in special:
+            scores[i] = np.sign(self.polarity_of_tokens(tokenized[i]))
+
+        new_scores = dict(zip(unique, scores.tolist()))
+        result = np.array([new_scores[tweet] if tweet in new_scores else cache[tweet] for tweet in tweets],
+                          dtype=int)
+
+        if len(new_scores) <= self.cache_size:
+            if len(cache) + len(new_scores) > self.cache_size:
+                self.cache = dict(new_scores)
+            else:
+                cache.update(new_scores)
+
+        return result
+
+    def disagreement_rate(self, tweets, sample_size=None, seed=0):
+        """
+        Compare scores against textblob on (a sample of) tweets
+        :param tweets: iterable of raw tweet text
+        :param sample_size: number of tweets to compare (all if None)
+        :param seed: random seed for sampling
+        :return: fraction of tweets where the scores differ and list of the differing tweets
+        """
+        tweets = list(tweets)
+
+        if sample_size is not None and sample_size < len(tweets):
+            sample = np.random.RandomState(seed).choice(len(tweets), sample_size, replace=False)
+            tweets = [tweets[i] for i in sample]
+
+        if len(tweets) == 0:
+            return 0.0, []
+
+        scores = self.score(tweets)
+        disagreements = [tweet for tweet, score in zip(tweets, scores)
+                         if score != np.sign(TextBlob(URL_PUNCT_PATTERN.sub('', tweet)).sentiment.polarity)]
+
+        return len(disagreements)/len(tweets), disagreements
@@ -0,0 +1,109 @@
+import re
+from functools import lru_cache
+from nltk.corpus import stopwords
+from nltk.stem import WordNetLemmatizer
+
+
+# Urls and punctuation removed in a single regex pass (urls are matched first at each position,
+# so the result is the same as removing urls and then punctuation)
+URL_PUNCT_PATTERN = re.compile(r"http\S+|[^\w\s]")
+
+# Once punctuation is stripped, these are the only words nltk.word_tokenize still splits apart
+# (treebank contraction rules), so they are split here to produce the same tokens
+TOKEN_SPLITS = {'cannot': ('can', 'not'),
+                'gimme': ('gim', 'me'),
+                'gonna': ('gon', 'na'),
+                'gotta': ('got', 'ta'),
+                'lemme': ('lem', 'me'),
+                'wanna': ('wan', 'na')}
+
+
+class TweetNormalizer:
+
+    def __init__(self, extra_stopwords=('amp',), lemma_cache_size=100000):
+        """
+        Initialize normalizer - stop words and lemmatizer are built once and reused for every tweet
+        :param extra_stopwords: words to remove in addition to nltk english stop words
+        :param lemma_cache_size: max number of distinct words to keep in the lemma LRU cache
+        """
+        self.stops = frozenset(stopwords.words("english") + list(extra_stopwords))
+        self.lemmatizer = WordNetLemmatizer()
+        self.lemmatize = lru_cache(maxsize=lemma_cache_size)(self.lemmatizer.lemmatize)
+
+    @staticmethod
+    def remove_urls_punct(tweet):
+        """
+        Remove links and special characters from tweet text
+        """
+        return URL_PUNCT_PATTERN.sub('', tweet)
+
+    def clean_words(self, tweet):
+        """
+        Remove urls and punctuation, convert to lowercase, remove stop words and lemmatize
+        :return: list of lemmas in tweet
+        """
+        words = self.remove_urls_punct(tweet).lower().split()
+
+        return [self.lemmatize(w) for w in words if w not in self.stops]
+
+    def clean(self, tweet):
+        """
+        Clean tweet and join lemmas back into a single string
+        """
+        return " ".join(self.clean_words(tweet))
+
+    def tokenize(self, tweet):
+        """
+        Clean and tokenize tweet in a single pass
+        :return: list of tokens, same as nltk.word_tokenize on the cleaned tweet
+        """
+        tokens = []
+
+        for lemma in self.clean_words(tweet):
+            tokens.extend(TOKEN_SPLITS.get(lemma, (lemma,)))
+
+        return tokens
+
+    def clean_batches(self, tweets, batch_size=5000):
+        """
+        Generator of cleaned tweets in batches. Repeated tweets within a batch are only cleaned once
+        :param tweets: iterable of raw tweet text
+        :param batch_size: number of tweets per batch
+        :return: yields lists of cleaned tweet text
+        """
+        for batch in self._batches(tweets, batch_size):
+            yield self._apply_unique(self.clean, batch)
+
+    def tokenize_batches(self, tweets, batch_size=5000):
+        """
+        Generator of tokenized tweets in batches. Repeated tweets within a batch are only tokenized once
+        :param tweets: iterable of raw tweet text
+        :param batch_size: number of tweets per batch
+        :return: yields lists of tokenized tweets
+        """
+        for batch in self._batches(tweets, batch_size):
+            yield self._apply_unique(self.tokenize, batch)
+
+    @staticmethod
+    def _batches(tweets, batch_size):
+        batch = []
+
+        for tweet in tweets:
+            batch.append(tweet)
+
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+
+        if batch:
+            yield batch
+
+    @staticmethod
+    def _apply_unique(func, batch):
+        results = {}
+
+        for tweet in batch:
+            if tweet not in results:
+                results[tweet] = func(tweet)
+
+        return [results[tweet] for tweet in batch]
@@ -0,0 +1,86 @@
+import heapq
+from collections import Counter
+
+
+class StreamingTopK:
+
+    def __init__(self, capacity=None):
+        """
+        Initialize streaming counter of most common items. With no capacity every distinct item is counted exactly.
+        With a capacity only that many counters are kept (Space-Saving summary, merged one batch at a time), so
+        memory stays bounded however many distinct items the stream has
+        :param capacity: max number of items to keep counts for (None counts exactly)
+        """
+        self.capacity = capacity
+        self.counts = Counter()
+        self.errors = {}
+        # Upper bound on the count of any item not in the summary
+        self.floor = 0
+        self.total = 0
+
+    def update(self, items):
+        """
+        Count a batch of items
+        :param items: iterable of hashable items (eg. words of a batch of tweets)
+        """
+        batch = Counter(items)
+        self.total += sum(batch.values())
+
+        if self.capacity is None:
+            self.counts.update(batch)
+            return
+
+        for item, count in batch.items():
+            if item in self.counts:
+                self.counts[item] += count
+            else:
+                # Item may have been seen (and evicted) before, so it starts at the floor
+                self.counts[item] = self.floor + count
+                self.errors[item] = self.floor
+
+        if len(self.counts) > self.capacity:
+            self.prune()
+
+    def update_batches(self, batches):
+        """
+        Count a stream of batches, eg. tokenized tweets read from the database in chunks
+        :param batches: iterable of iterables of items
+        """
+        for batch in batches:
+            self.update(batch)
+
+        return self
+
+    def prune(self):
+        """
+        Drop all but the largest capacity counters, raising the floor to the largest dropped count
+        """
+        keep = heapq.nlargest(self.capacity, self.counts.items(), key=lambda item: item[1])
+        kept = set(item for item, _ in keep)
+
+        for item, count in self.counts.items():
+            if item not in kept:
+                self.floor = max(self.floor, count)
+
+        self.counts = Counter(dict(keep))
+        self.errors = {item: self.errors.get(item, 0) for item in kept}
+
+    def most_common(self, n=None):
+        """
+        :param n: number of items to return (all counted items if None)
+        :return: list of (item, count) tuples, most common first. In approximate mode counts may overestimate
+        the true count by at most error(item)
+        """
+        return self.counts.most_common(n)
+
+    def top(self, n):
+        """
+        :return: list of the n most common items
+        """
+        return [item for item, _ in self.most_common(n)]
+
+    def error(self, item):
+        """
+        Max amount the count of item overestimates its true count (always 0 when counting exactly)
+        """
+        return self.errors.get(item, 0)
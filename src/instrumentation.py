@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import threading
+import tracemalloc
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+
+
+class RunMetrics:
+
+    def __init__(self, name, trace_memory=False):
+        """
+        Initialize metrics for one run of a pipeline - time, peak memory and row counts per stage
+        :param name: name of the run (eg. CLI command name), used in the metrics file name
+        :param trace_memory: measure peak memory allocated in each stage with tracemalloc (slows allocations down).
+        Stages nested in another stage only get a peak on Python 3.9+, where tracemalloc can reset it
+        """
+        self.name = name
+        self.trace_memory = trace_memory
+        self.started_at = datetime.utcnow()
+        self.stages = OrderedDict()
+        self.open_peaks = []
+
+    def record(self, name, seconds=0.0, rows=None, peak_mb=None):
+        """
+        Add time, rows and peak memory to a stage. Stages run more than once (eg. per batch) accumulate
+        """
+        stage = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'rows': None, 'peak_mb': None})
+        stage['calls'] += 1
+        stage['seconds'] += seconds
+
+        if rows is not None:
+            stage['rows'] = (stage['rows'] or 0) + rows
+
+        if peak_mb is not None:
+            stage['peak_mb'] = max(stage['peak_mb'] or 0.0, peak_mb)
+
+    def count(self, name, rows):
+        """
+        Add rows to a stage without timing anything
+        """
+        stage = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'rows': None, 'peak_mb': None})
+        stage['rows'] = (stage['rows'] or 0) + rows
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """
+        Context manager timing a stage (and tracing its peak memory when trace_memory is set)
+        :param rows: number of rows the stage processes, if known up front (see count otherwise)
+        """
+        tracing = self.trace_memory and self._start_trace()
+        start = time.perf_counter()
+
+        try:
+            yield self
+        finally:
+            seconds = time.perf_counter() - start
+            peak_mb = self._stop_trace() if tracing else None
+            self.record(name, seconds=seconds, rows=rows, peak_mb=peak_mb)
+
+    def timed_iter(self, name, iterable):
+        """
+        Wrap an iterable (eg. pages fetched from an API) so the time spent producing each item counts towards a stage
+        """
+        iterator = iter(iterable)
+
+        while True:
+            start = time.perf_counter()
+
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.record(name, seconds=time.perf_counter() - start)
+                return
+
+            self.record(name, seconds=time.perf_counter() - start, rows=len(item) if hasattr(item, '__len__') else 1)
+            yield item
+
+    def _start_trace(self):
+        started = not tracemalloc.is_tracing()
+
+        if started:
+            tracemalloc.start()
+
+        current, peak = tracemalloc.get_traced_memory()
+
+        # Peak of an enclosing stage so far is kept before the peak is reset for this stage
+        if self.open_peaks:
+            self.open_peaks[-1][1] = max(self.open_peaks[-1][1], peak)
+
+        # Without reset_peak (before Python 3.9) only a freshly started trace measures this stage's peak,
+        # a nested stage (or one traced from outside) would report the enclosing peak, so none is recorded
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+            measured = True
+        else:
+            measured = started
+
+        self.open_peaks.append([current, current, measured, started])
+        return True
+
+    def _stop_trace(self):
+        start, peak, measured, started = self.open_peaks.pop()
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+
+        if self.open_peaks:
+            self.open_peaks[-1][1] = max(self.open_peaks[-1][1], peak)
+
+        if started:
+            tracemalloc.stop()
+
+        return (peak - start) / 2 ** 20 if measured else None
+
+    def summary(self):
+        """
+        :return: dictionary with run name, start time, total seconds and per stage metrics
+        """
+        return {'run': self.name,
+                'started_at': self.started_at.isoformat(),
+                'seconds': (datetime.utcnow() - self.started_at).total_seconds(),
+                'stages': self.stages}
+
+    def write(self, directory='data/metrics'):
+        """
+        Print a summary of the run and write its metrics to a json file
+        :return: path of metrics file
+        """
+        for name, stage in self.stages.items():
+            print('{:<20} {:9.2f}s {:>10} rows {}'.format(
+                name, stage['seconds'], '-' if stage['rows'] is None else stage['rows'],
+                '' if stage['peak_mb'] is None else '{:.1f} MB peak'.format(stage['peak_mb'])))
+
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, '{}-{}.json'.format(self.name, self.started_at.strftime('%Y%m%dT%H%M%S')))
+
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+        print('Run metrics saved to {}'.format(path))
+        return path
+
+
+# Upper bounds (seconds) of latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class LatencyHistograms:
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """
+        Initialize thread safe latency histograms, one per stage (eg. twitter fetch, feature generation, inference)
+        :param buckets: sorted upper bounds in seconds, latencies above the last bound go in an overflow bucket
+        """
+        self.buckets = tuple(buckets)
+        self.histograms = OrderedDict()
+        self.lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        """
+        Record one latency for a stage
+        """
+        with self.lock:
+            histogram = self.histograms.get(stage)
+
+            if histogram is None:
+                histogram = self.histograms[stage] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0,
+                                                      'max': 0.0}
+
+            histogram['counts'][bisect_left(self.buckets, seconds)] += 1
+            histogram['sum'] += seconds
+            histogram['max'] = max(histogram['max'], seconds)
+
+    @contextmanager
+    def time(self, stage):
+        """
+        Context manager recording how long its block takes, including blocks that raise
+        """
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def percentile(self, counts, q):
+        """
+        Upper bound of the bucket holding the q-th percentile latency (max latency if it's in the overflow bucket)
+        """
+        rank = q / 100.0 * sum(counts)
+        seen = 0
+
+        for i, count in enumerate(counts):
+            seen += count
+
+            if count and seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else None
+
+        return None
+
+    def snapshot(self):
+        """
+        :return: dictionary of stage to count, mean, max, approximate p50/p95/p99 and bucket counts
+        """
+        with self.lock:
+            histograms = [(stage, dict(h, counts=list(h['counts']))) for stage, h in self.histograms.items()]
+
+        snapshot = OrderedDict()
+
+        for stage, histogram in histograms:
+            counts = histogram['counts']
+            n = sum(counts)
+            labels = ['le_{}'.format(bound) for bound in self.buckets] + ['le_inf']
+
+            snapshot[stage] = {'count': n,
+                               'mean': histogram['sum'] / n if n else None,
+                               'max': histogram['max'],
+                               'buckets': OrderedDict(zip(labels, counts))}
+
+            for q in (50, 95, 99):
+                snapshot[stage]['p{}'.format(q)] = self.percentile(counts, q) or histogram['max']
+
+        return snapshot
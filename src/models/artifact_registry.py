@@ -0,0 +1,201 @@
+import hashlib
+import os
+import pickle
+import threading
+import time
+
+
+def load_pickle(path):
+    """Default artifact loader"""
+    with open(path, 'rb') as file:
+        return pickle.load(file)
+
+
+def file_checksum(path):
+    """sha256 checksum of file contents"""
+    checksum = hashlib.sha256()
+
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            checksum.update(block)
+
+    return checksum.hexdigest()
+
+
+class Artifact:
+
+    def __init__(self, path, loader):
+        """
+        Initialize artifact - nothing is read from disk until the first get
+        """
+        self.path = path
+        self.loader = loader
+        self.value = None
+        self.mtime = None
+        self.size = None
+        self.checksum = None
+        self.last_checked = None
+
+
+class ArtifactGroup:
+
+    def __init__(self, members):
+        """
+        Initialize group of artifacts that must be used together (eg. a text model and the vocabulary its
+        features were built with). The group's value is a dictionary of member name to loaded artifact,
+        replaced as a whole so readers never mix versions
+        :param members: dictionary of member name to Artifact
+        """
+        self.members = members
+        self.value = None
+        self.pending = None
+        self.last_checked = None
+
+
+# Process-wide cache of models and vocabularies, loaded once and shared read-only across requests
+class ArtifactRegistry:
+
+    def __init__(self, check_interval=5):
+        """
+        Initialize registry
+        :param check_interval: minimum seconds between checks of an artifact's file for changes
+        """
+        self.check_interval = check_interval
+        self.artifacts = {}
+        self.lock = threading.Lock()
+
+    def register(self, name, path, loader=load_pickle):
+        """
+        Register an artifact file under a name
+        :param name: name used to get the artifact
+        :param path: path to artifact file
+        :param loader: function taking the file path and returning the loaded artifact
+        """
+        self.artifacts[name] = Artifact(path=path, loader=loader)
+
+    def register_group(self, name, paths, loaders=None):
+        """
+        Register artifact files that are loaded and swapped together under one name. get returns a dictionary of
+        member name to artifact, so a request that takes all members from one get never pairs versions
+        :param name: name used to get the group
+        :param paths: dictionary of member name to artifact file path
+        :param loaders: dictionary of member name to loader (members not in it are unpickled)
+        """
+        loaders = loaders or {}
+        self.artifacts[name] = ArtifactGroup({member: Artifact(path=path, loader=loaders.get(member, load_pickle))
+                                              for member, path in paths.items()})
+
+    def get(self, name):
+        """
+        Return the loaded artifact (or dictionary of a group's artifacts), reloading it first if its files have
+        changed since it was loaded
+        """
+        artifact = self.artifacts[name]
+
+        if artifact.last_checked is None or time.time() - artifact.last_checked >= self.check_interval:
+            if isinstance(artifact, ArtifactGroup):
+                self.refresh_group(artifact)
+            else:
+                self.refresh(artifact)
+
+        return artifact.value
+
+    def refresh(self, artifact):
+        """
+        Reload artifact if the file's mtime or size changed and its checksum differs from the loaded version.
+        The new version is fully loaded before it replaces the old one, so readers never see a partial load.
+        If the file is missing or can't be loaded (eg. it is still being written) the old version is kept
+        """
+        with self.lock:
+            artifact.last_checked = time.time()
+
+            try:
+                stat = os.stat(artifact.path)
+            except OSError as e:
+                if artifact.value is None:
+                    raise e
+                print('Could not check {}, keeping loaded version: {}'.format(artifact.path, e))
+                return
+
+            if artifact.value is not None and (stat.st_mtime, stat.st_size) == (artifact.mtime, artifact.size):
+                return
+
+            checksum = file_checksum(artifact.path)
+
+            if artifact.value is not None and checksum == artifact.checksum:
+                artifact.mtime, artifact.size = stat.st_mtime, stat.st_size
+                return
+
+            try:
+                value = artifact.loader(artifact.path)
+            except Exception as e:
+                if artifact.value is None:
+                    raise e
+                print('Could not reload {}, keeping loaded version: {}'.format(artifact.path, e))
+                return
+
+            artifact.value = value
+            artifact.mtime, artifact.size, artifact.checksum = stat.st_mtime, stat.st_size, checksum
+            print('Loaded {}'.format(artifact.path))
+
+    def refresh_group(self, group):
+        """
+        Reload a group when any member's file changed. Changed files are only loaded once they are unchanged
+        between two checks (so a deploy replacing several files is picked up as a whole), every changed member is
+        loaded before any is swapped in, and if any member is missing or fails to load the loaded group is kept
+        """
+        with self.lock:
+            group.last_checked = time.time()
+
+            try:
+                stats = {member: os.stat(artifact.path) for member, artifact in group.members.items()}
+            except OSError as e:
+                if group.value is None:
+                    raise e
+                print('Could not check artifact group, keeping loaded version: {}'.format(e))
+                return
+
+            signature = {member: (stat.st_mtime, stat.st_size) for member, stat in stats.items()}
+            changed = [member for member, artifact in group.members.items()
+                       if group.value is None or signature[member] != (artifact.mtime, artifact.size)]
+
+            if not changed:
+                group.pending = None
+                return
+
+            # Wait for files still being replaced to settle (the first load can't wait)
+            if group.value is not None and signature != group.pending:
+                group.pending = signature
+                return
+
+            loaded = {}
+
+            try:
+                for member in changed:
+                    artifact = group.members[member]
+                    checksum = file_checksum(artifact.path)
+
+                    if group.value is not None and checksum == artifact.checksum:
+                        loaded[member] = (group.value[member], checksum)
+                    else:
+                        loaded[member] = (artifact.loader(artifact.path), checksum)
+            except Exception as e:
+                if group.value is None:
+                    raise e
+                print('Could not reload artifact group, keeping loaded version: {}'.format(e))
+                return
+
+            value = dict(group.value or {})
+
+            for member, (member_value, checksum) in loaded.items():
+                artifact = group.members[member]
+                artifact.value = value[member] = member_value
+                artifact.mtime, artifact.size = signature[member]
+                artifact.checksum = checksum
+
+            group.value = value
+            group.pending = None
+            print('Loaded {}'.format(', '.join(group.members[member].path for member in changed)))
+
+
+registry = ArtifactRegistry()
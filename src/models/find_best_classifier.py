@@ -1,9 +1,14 @@
+import os
+import hashlib
+import math
 import numpy as np
 import operator
-import pandas as pd
+from scipy import sparse
+from src.data.storage import read_frame, frame_columns
 from pandas_ml import ConfusionMatrix
 from sklearn import model_selection
-from sklearn.metrics import log_loss, roc_auc_score, classification_report
+from sklearn.base import clone
+from sklearn.metrics import get_scorer, log_loss, roc_auc_score, classification_report
 from sklearn.linear_model import LogisticRegression
 from sklearn.tree import DecisionTreeClassifier
 from sklearn.neighbors import KNeighborsClassifier
@@ -11,14 +16,171 @@ from sklearn.discriminant_analysis import LinearDiscriminantAnalysis
 from sklearn.naive_bayes import GaussianNB
 from sklearn.ensemble import RandomForestClassifier
 
+try:
+    import joblib
+except ImportError:
+    from sklearn.externals import joblib
 
-def find_best_classifier(features, response, set_seed, k_folds, crossval_scoring):
+
+# Models that only fit dense arrays, left out when comparing models on sparse features
+DENSE_ONLY_MODELS = ('LinearDiscriminantAnalysis', 'NaiveBayesGaussian')
+
+
+def spot_check_models(seed=None, sparse_features=False):
+    """
+    Models compared by find_best_classifier, as (name, unfitted model) tuples
+    :param seed: random_state of the randomized models, so their cached fold scores can be reproduced
+    :param sparse_features: only include models that fit scipy.sparse features without densifying them
+    """
+    models = []
+    models.append(('LogisticRegression', LogisticRegression()))
+    models.append(('LinearDiscriminantAnalysis', LinearDiscriminantAnalysis()))
+    models.append(('KNeighborsClassifier', KNeighborsClassifier()))
+    models.append(('DecisionTree', DecisionTreeClassifier(random_state=seed)))
+    models.append(('NaiveBayesGaussian', GaussianNB()))
+    models.append(('RandomForest', RandomForestClassifier(random_state=seed)))
+
+    if sparse_features:
+        models = [(name, model) for name, model in models if name not in DENSE_ONLY_MODELS]
+
+    return models
+
+
+def data_hash(features, response):
+    """
+    Fingerprint of the training data, so cached fold results are only reused for the same data
+    """
+    sha = hashlib.sha1()
+
+    # Sparse matrices are fingerprinted by their shape and CSR arrays
+    if sparse.issparse(features):
+        features = features.tocsr()
+        sha.update('{}'.format(features.shape).encode('utf-8'))
+        arrays = (features.data, features.indices, features.indptr, response)
+    else:
+        arrays = (features, response)
+
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        sha.update('{}{}'.format(array.shape, array.dtype).encode('utf-8'))
+        sha.update(array.tobytes())
+
+    return sha.hexdigest()
+
+
+def model_hash(model):
+    """
+    Fingerprint of a model's class and parameters
+    """
+    params = sorted(model.get_params().items())
+    description = '{}.{}{}'.format(type(model).__module__, type(model).__name__, params)
+
+    return hashlib.sha1(description.encode('utf-8')).hexdigest()
+
+
+def evaluate_fold(model, features, response, train_index, test_index, scoring, cache_path):
+    """
+    Fit a copy of model on one cross validation fold, score it on the held out rows and cache the result on disk
+    :return: score of the fold
+    """
+    estimator = clone(model)
+    estimator.fit(features[train_index], response[train_index])
+    score = get_scorer(scoring)(estimator, features[test_index], response[test_index])
+
+    joblib.dump({'score': score}, cache_path)
+
+    return score
+
+
+def cross_validate_pairs(tasks, features, response, folds, scoring, n_jobs, cache_dir, data_key, seed):
+    """
+    Score every (model, fold) pair, reading cached results where the data, model parameters, fold and training
+    size haven't changed and fitting the rest in parallel
+    :param tasks: list of (name, model, n_samples) - n_samples is the number of training rows used in each fold
+    (None uses all of them)
+    :param folds: list of (train index, test index) tuples
+    :return: dictionary of name to array of fold scores
+    """
+    rand = np.random.RandomState(seed)
+    samples = [rand.permutation(train_index) for train_index, _ in folds]
+
+    scores = {}
+    jobs = []
+
+    for name, model, n_samples in tasks:
+        scores[name] = [None] * len(folds)
+
+        for fold, (_, test_index) in enumerate(folds):
+            key = '{}-{}-{}-{}-{}-{}'.format(data_key, model_hash(model), scoring, len(folds), fold, n_samples)
+            cache_path = os.path.join(cache_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.pkl')
+
+            if os.path.exists(cache_path):
+                scores[name][fold] = joblib.load(cache_path)['score']
+            else:
+                train_index = np.sort(samples[fold][:n_samples])
+                jobs.append((name, fold, (model, features, response, train_index, test_index, scoring, cache_path)))
+
+    print('Fitting {} model folds ({} cached)'.format(len(jobs), len(tasks) * len(folds) - len(jobs)))
+
+    results = joblib.Parallel(n_jobs=n_jobs)(joblib.delayed(evaluate_fold)(*args) for _, _, args in jobs)
+
+    for (name, fold, _), score in zip(jobs, results):
+        scores[name][fold] = score
+
+    return {name: np.array(fold_scores) for name, fold_scores in scores.items()}
+
+
+def successive_halving(models, features, response, folds, scoring, n_jobs, cache_dir, data_key, seed, eta=3,
+                       min_samples=1000):
+    """
+    Evaluate expensive models on a growing number of training rows, keeping the best 1/eta of them each round,
+    so only the most promising models are trained on all rows
+    :param models: list of (name, model) tuples
+    :param eta: fraction of models kept (1/eta) and growth of training rows each round
+    :param min_samples: training rows per fold in the first round
+    :return: dictionary of name to array of fold scores on all training rows (surviving models only)
+    """
+    n_train = min(len(train_index) for train_index, _ in folds)
+    rounds = max(0, int(math.floor(math.log(n_train / min_samples, eta)))) if n_train > min_samples else 0
+    candidates = list(models)
+
+    for r in range(rounds, 0, -1):
+        if len(candidates) <= 1:
+            break
+
+        n_samples = int(n_train / eta ** r)
+        scores = cross_validate_pairs([(name, model, n_samples) for name, model in candidates], features, response,
+                                      folds, scoring, n_jobs, cache_dir, data_key, seed)
+
+        ranked = sorted(candidates, key=lambda candidate: scores[candidate[0]].mean(), reverse=True)
+        keep = int(math.ceil(len(candidates) / eta))
+
+        for name, _ in ranked[keep:]:
+            print("%s: stopped early with %s (%f) on %d rows" % (name, scoring, scores[name].mean(), n_samples))
+
+        candidates = ranked[:keep]
+
+    return cross_validate_pairs([(name, model, None) for name, model in candidates], features, response, folds,
+                                scoring, n_jobs, cache_dir, data_key, seed)
+
+
+def find_best_classifier(features, response, set_seed, k_folds, crossval_scoring, n_jobs=-1,
+                         cache_dir='models/cv_cache', expensive_models=(), eta=3):
 
     """Rapidly test multiple classifiers on a data set using cross validation.
         Evaluate performance to find model with highest score as defined by
-        the 'crossval_scoring' argument ('accuracy','roc_auc', 'precision', 'recall', etc)"""
+        the 'crossval_scoring' argument ('accuracy','roc_auc', 'precision', 'recall', etc).
+        Model folds are fit in parallel on n_jobs cores and cached in cache_dir, so a rerun only fits
+        models whose data or parameters changed. Models named in expensive_models are compared by
+        successive halving and only the best 1/eta of them are trained on all rows.
+        Features can be a numpy.ndarray or a scipy.sparse matrix (eg. the text features), which is kept sparse
+        and only compared on models that accept sparse input"""
 
-    if isinstance(features, np.ndarray) and isinstance(response, np.ndarray):
+    if sparse.issparse(features):
+        # CSR rows can be selected by fold index
+        features = features.tocsr()
+
+    if (isinstance(features, np.ndarray) or sparse.issparse(features)) and isinstance(response, np.ndarray):
 
         # Split features and response into training and validation sets
         validation_size = 0.20
@@ -30,27 +192,27 @@ def find_best_classifier(features, response, set_seed, k_folds, crossval_scoring
         scoring=crossval_scoring
 
         # Spot Check Algorithms
-        models = []
-        models.append(('LogisticRegression', LogisticRegression()))
-        models.append(('LinearDiscriminantAnalysis', LinearDiscriminantAnalysis()))
-        models.append(('KNeighborsClassifier', KNeighborsClassifier()))
-        models.append(('DecisionTree', DecisionTreeClassifier()))
-        models.append(('NaiveBayesGaussian', GaussianNB()))
-        models.append(('RandomForest', RandomForestClassifier()))
-
-        # Evaluate each model in turn
-        results = []
-        names = []
-
-        for name, model in models:
-            kfold = model_selection.StratifiedKFold(n_splits=k_folds, random_state=seed)
-            cv_results = model_selection.cross_val_score(model, X_train, Y_train, cv=kfold, scoring=scoring)
-            results.append(cv_results)
-            names.append(name)
-            msg = "%s: %s (%f), std (%f)" % (name, scoring, cv_results.mean(), cv_results.std())
+        models = spot_check_models(seed=seed, sparse_features=sparse.issparse(features))
+
+        # Evaluate every model and fold, expensive models by successive halving
+        os.makedirs(cache_dir, exist_ok=True)
+        data_key = data_hash(X_train, Y_train)
+        folds = list(model_selection.StratifiedKFold(n_splits=k_folds).split(X_train, Y_train))
+
+        cv_results = cross_validate_pairs([(name, model, None) for name, model in models
+                                           if name not in expensive_models],
+                                          X_train, Y_train, folds, scoring, n_jobs, cache_dir, data_key, seed)
+        cv_results.update(successive_halving([(name, model) for name, model in models if name in expensive_models],
+                                             X_train, Y_train, folds, scoring, n_jobs, cache_dir, data_key, seed,
+                                             eta=eta))
+
+        models = [(name, model) for name, model in models if name in cv_results]
+
+        for name, _ in models:
+            msg = "%s: %s (%f), std (%f)" % (name, scoring, cv_results[name].mean(), cv_results[name].std())
             print(msg)
 
-        zipped_eval = zip(models, [i.mean() for i in results])
+        zipped_eval = zip(models, [cv_results[name].mean() for name, _ in models])
         model_eval = sorted(zipped_eval, key=operator.itemgetter(1))
 
         best_clf = model_eval[-1][0][1]
@@ -72,12 +234,17 @@ def find_best_classifier(features, response, set_seed, k_folds, crossval_scoring
         return best_clf
 
     else:
-        raise Warning("Features and response inputs must be of type numpy.ndarray")
+        raise Warning("Features must be a numpy.ndarray or scipy.sparse matrix and response a numpy.ndarray")
 
 
-data = pd.read_pickle('data/base_features.pkl')
+if __name__ == '__main__':
+    # Only read the feature and target columns from disk
+    base_features_path = 'data/processed/base_features.parquet'
+    data = read_frame(base_features_path,
+                      columns=[col for col in frame_columns(base_features_path) if col != 'tweet_id'])
 
-y = np.array(data.pop('target'))
-X = np.array(data.drop(['id'], axis=1))
+    y = np.array(data.pop('target'))
+    X = np.array(data)
 
-best_clf = find_best_classifier(X, y, set_seed=42, k_folds=3, crossval_scoring='roc_auc')
+    best_clf = find_best_classifier(X, y, set_seed=42, k_folds=3, crossval_scoring='roc_auc',
+                                    expensive_models=('KNeighborsClassifier', 'RandomForest'))
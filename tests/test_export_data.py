@@ -0,0 +1,141 @@
+import pandas as pd
+import pytest
+from src.data.export_data import RequestError, add_new_rows, find_new_rows
+
+
+class MemoryCell:
+
+    def __init__(self, row, col, value=''):
+        self.row = row
+        self.col = col
+        self.value = value
+
+
+class MemoryWorksheet:
+
+    def __init__(self, failures=None):
+        """
+        In-memory stand-in for the parts of a gspread worksheet add_new_rows and update_google_sheet use.
+        Cells hold text like a sheet does. Counts requests made, and raises RequestError on the update requests
+        numbered in failures
+        """
+        self.cells = {}
+        self.requests = 0
+        self.updates = 0
+        self.failures = set(failures or [])
+
+    @staticmethod
+    def parse_cell(label):
+        letters = ''.join(c for c in label if c.isalpha())
+        column = 0
+
+        for letter in letters:
+            column = column * 26 + ord(letter) - ord('A') + 1
+
+        return int(label[len(letters):]), column
+
+    def range(self, range_build):
+        self.requests += 1
+        (first_row, first_col), (last_row, last_col) = [self.parse_cell(label) for label in range_build.split(':')]
+
+        return [MemoryCell(row, col, self.cells.get((row, col), ''))
+                for row in range(first_row, last_row + 1) for col in range(first_col, last_col + 1)]
+
+    def update_cells(self, cell_list):
+        self.requests += 1
+        self.updates += 1
+
+        if self.updates in self.failures:
+            raise RequestError('Authorization expired')
+
+        for cell in cell_list:
+            self.cells[(cell.row, cell.col)] = str(cell.value)
+
+    def col_values(self, col):
+        self.requests += 1
+        last_row = max([row for row, column in self.cells if column == col] or [0])
+
+        return [self.cells.get((row, col), '') for row in range(1, last_row + 1)]
+
+    def acell(self, label):
+        self.requests += 1
+        row, col = self.parse_cell(label)
+
+        return MemoryCell(row, col, self.cells.get((row, col), ''))
+
+    def rows(self):
+        last_row = max(row for row, _ in self.cells)
+        last_col = max(col for _, col in self.cells)
+
+        return [[self.cells.get((row, col), '') for col in range(1, last_col + 1)] for row in range(2, last_row + 1)]
+
+
+class MemoryClient:
+
+    def __init__(self):
+        self.logins = 0
+
+    def login(self):
+        self.logins += 1
+
+
+HEADER = ['name', 'party', 'tweet_id', 'twitter_screen_name', 'created_at']
+
+
+def tweets(n):
+    return pd.DataFrame({'name': ['Rep {}'.format(i % 7) for i in range(n)],
+                         'party': ['Democrat' if i % 2 else 'Republican' for i in range(n)],
+                         'tweet_id': [str(1000 + i) for i in range(n)],
+                         'twitter_screen_name': ['rep{}'.format(i % 7) for i in range(n)],
+                         'created_at': pd.date_range('2018-01-01', periods=n, freq='H')},
+                        columns=HEADER)
+
+
+def sheet_with_header(**kwargs):
+    sheet = MemoryWorksheet(**kwargs)
+
+    for col, value in enumerate(HEADER, start=1):
+        sheet.cells[(1, col)] = value
+
+    return sheet
+
+
+def test_rows_written_in_chunks():
+    df = tweets(1234)
+    sheet = sheet_with_header()
+
+    next_row = add_new_rows(df, sheet, first_blank_row=2, gs_client=MemoryClient(), chunk_size=500)
+
+    assert next_row == 1236
+    assert sheet.requests == 2 * 3
+    assert sheet.rows() == df.astype(str).values.tolist()
+
+
+def test_chunk_retried_after_request_error():
+    df = tweets(1000)
+    sheet = sheet_with_header(failures=[2])
+    client = MemoryClient()
+
+    next_row = add_new_rows(df, sheet, first_blank_row=2, gs_client=client, chunk_size=400)
+
+    assert next_row == 1002
+    assert client.logins == 1
+    assert sheet.updates == 4
+    assert sheet.rows() == df.astype(str).values.tolist()
+
+
+def test_resume_after_last_written_chunk():
+    df = tweets(1000)
+    sheet = sheet_with_header(failures=[3, 4])
+
+    with pytest.raises(RequestError):
+        add_new_rows(df, sheet, first_blank_row=2, gs_client=MemoryClient(), chunk_size=300, max_retries=1)
+
+    first_blank_row, new_rows = find_new_rows(df, sheet)
+
+    assert first_blank_row == 602
+    assert len(new_rows) == 400
+
+    add_new_rows(new_rows, sheet, first_blank_row=first_blank_row, gs_client=MemoryClient(), chunk_size=300)
+
+    assert sheet.rows() == df.astype(str).values.tolist()
@@ -0,0 +1,24 @@
+import numpy as np
+import pandas as pd
+from src.features.feature_functions import build_word_index, find_text_features, tokens_to_sparse
+
+
+TOKENS = [['tax', 'reform', 'families'],
+          ['proud', 'veterans', 'tax'],
+          [],
+          ['zebra', 'healthcare', 'healthcare', 'vote'],
+          ['budget']]
+
+WORD_FEATURES = ['tax', 'healthcare', 'vote', 'families', 'budget', 'veterans', 'jobs']
+
+
+def test_sparse_features_match_dataframe_features():
+    # Word feature dataframes had one column per word, sorted alphabetically
+    expected = pd.DataFrame([find_text_features(tweet, feature_set=WORD_FEATURES) for tweet in TOKENS])
+    expected = expected.reindex(columns=sorted(expected.columns))
+
+    word_index = build_word_index(WORD_FEATURES)
+    features = tokens_to_sparse(TOKENS, word_index=word_index)
+
+    assert sorted(word_index, key=word_index.get) == list(expected.columns)
+    assert np.array_equal(features.toarray(), expected.values)
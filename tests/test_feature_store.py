@@ -0,0 +1,59 @@
+import pandas as pd
+from sqlalchemy import create_engine
+from src.features import feature_functions as feat_funcs
+from src.features import feature_store
+from src.features.feature_store import generate_features_incremental
+
+
+def tweets():
+    return pd.DataFrame({'tweet_id': ['101', '102', '103', '101'],
+                         'created_at': pd.to_datetime(['2018-01-01 09:00', '2018-01-02 17:30', '2018-01-06 12:00',
+                                                       '2018-01-01 09:00']),
+                         'media_type': ['{photo}', None, None, '{photo}'],
+                         'text': ['Great day for American families!', 'This bill is a TERRIBLE idea',
+                                  'Read my statement', 'Great day for American families!'],
+                         'user_followers': [1000, 0, 50, 1000],
+                         'retweet_count': [10, 2, 0, 10],
+                         'favorite_count': [30, 1, 5, 30],
+                         'text_length': [32, 28, 17, 32],
+                         'party': ['Democrat', 'Republican', 'Democrat', 'Democrat']})
+
+
+def test_same_batch_generated_twice(monkeypatch):
+    engine = create_engine('sqlite://')
+    expected = feat_funcs.select_base_features(feat_funcs.generate_content_features(tweets()))
+    empty_store = feature_store.load_feature_store(engine)
+
+    first = generate_features_incremental(tweets(), engine=engine)
+
+    # An overlapping run read the store before the first run wrote to it, so generates every tweet again
+    with monkeypatch.context() as patch:
+        patch.setattr(feature_store, 'load_feature_store', lambda engine, version=None: empty_store)
+        second = generate_features_incremental(tweets(), engine=engine)
+
+    third = generate_features_incremental(tweets(), engine=engine)
+
+    stored = pd.read_sql_query('SELECT tweet_id FROM tweet_features', con=engine)
+    assert sorted(stored['tweet_id']) == ['101', '102', '103']
+
+    for features in [first, second, third]:
+        assert len(features) == 4
+        pd.testing.assert_frame_equal(features.reset_index(drop=True), expected.reset_index(drop=True),
+                                      check_dtype=False)
+
+
+def test_duplicate_stored_features_removed():
+    engine = create_engine('sqlite://')
+    generate_features_incremental(tweets(), engine=engine)
+
+    # Tables written before tweet_id was unique can hold the same tweet more than once
+    stored = pd.read_sql_query('SELECT * FROM tweet_features', con=engine)
+    stored.to_sql('tweet_features', con=engine, if_exists='replace', index=False)
+    stored.to_sql('tweet_features', con=engine, if_exists='append', index=False)
+
+    extra = tweets().iloc[:3].assign(tweet_id=['101', '102', '104'])
+    features = generate_features_incremental(extra, engine=engine)
+
+    stored = pd.read_sql_query('SELECT tweet_id FROM tweet_features', con=engine)
+    assert sorted(stored['tweet_id']) == ['101', '102', '103', '104']
+    assert list(features['tweet_id']) == ['101', '102', '104']
@@ -0,0 +1,46 @@
+import tracemalloc
+from src.instrumentation import RunMetrics
+
+
+def allocate(mb):
+    return bytearray(mb * 2 ** 20)
+
+
+def run_stages(metrics):
+    with metrics.stage('outer'):
+        with metrics.stage('large'):
+            block = allocate(20)
+            del block
+
+        with metrics.stage('small'):
+            block = allocate(2)
+            del block
+
+    with metrics.stage('after'):
+        block = allocate(1)
+        del block
+
+
+def test_stage_peaks_are_relative_to_stage_start():
+    metrics = RunMetrics('test', trace_memory=True)
+    run_stages(metrics)
+
+    assert 19 < metrics.stages['outer']['peak_mb'] < 25
+    assert 19 < metrics.stages['large']['peak_mb'] < 25
+    assert 1 < metrics.stages['small']['peak_mb'] < 5
+    assert 0.5 < metrics.stages['after']['peak_mb'] < 5
+    assert not tracemalloc.is_tracing()
+
+
+def test_nested_peaks_dropped_without_reset_peak(monkeypatch):
+    if hasattr(tracemalloc, 'reset_peak'):
+        monkeypatch.delattr(tracemalloc, 'reset_peak')
+
+    metrics = RunMetrics('test', trace_memory=True)
+    run_stages(metrics)
+
+    assert 19 < metrics.stages['outer']['peak_mb'] < 25
+    assert metrics.stages['large']['peak_mb'] is None
+    assert metrics.stages['small']['peak_mb'] is None
+    assert 0.5 < metrics.stages['after']['peak_mb'] < 5
+    assert not tracemalloc.is_tracing()
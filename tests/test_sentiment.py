@@ -0,0 +1,63 @@
+import threading
+import numpy as np
+from textblob import TextBlob
+from src.features.sentiment import LexiconSentiment
+from src.features.text_normalizer import URL_PUNCT_PATTERN
+
+
+TWEETS = ['Great day for American families!',
+          'This bill is a terrible, terrible idea.',
+          'Not good enough. We must do better',
+          'I am very happy to join the hearing today',
+          'never bad, always proud of our veterans',
+          'The deficit is not very small',
+          'Thank you :) see you at the town hall https://t.co/abc123',
+          'What a sad and BAD vote o_O',
+          'hearing_today was really, really important',
+          'RT @Rep0001: We will not back down #ProtectOurCare',
+          'Read my statement on the budget',
+          '',
+          'Happy happy happy',
+          'not not good']
+
+
+def textblob_sentiment(tweet):
+    return int(np.sign(TextBlob(URL_PUNCT_PATTERN.sub('', tweet)).sentiment.polarity))
+
+
+def test_scores_match_textblob():
+    scorer = LexiconSentiment()
+
+    assert list(scorer.score(TWEETS)) == [textblob_sentiment(tweet) for tweet in TWEETS]
+
+
+def test_cached_scores_match_first_scores():
+    scorer = LexiconSentiment(cache_size=5)
+    first = scorer.score(TWEETS)
+
+    assert list(scorer.score(TWEETS[::-1])) == list(first[::-1])
+    assert scorer.disagreement_rate(TWEETS)[0] == 0.0
+
+
+def test_shared_scorer_across_threads():
+    scorer = LexiconSentiment(cache_size=3)
+    expected = list(scorer.score(TWEETS))
+    errors = []
+
+    def score_repeatedly(offset):
+        try:
+            for i in range(200):
+                tweets = TWEETS[(offset + i) % len(TWEETS):] + TWEETS[:(offset + i) % len(TWEETS)]
+                scores = list(scorer.score(tweets))
+                assert scores == expected[(offset + i) % len(TWEETS):] + expected[:(offset + i) % len(TWEETS)]
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=score_repeatedly, args=(offset,)) for offset in range(4)]
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
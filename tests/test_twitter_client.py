@@ -0,0 +1,22 @@
+import pytest
+import requests
+import tweepy
+from src.data.db_functions import TwAPI
+
+
+class FailingSession:
+
+    def __init__(self, error):
+        self.error = error
+
+    def get(self, url, params=None, timeout=None):
+        raise self.error
+
+
+@pytest.mark.parametrize('error', [requests.ConnectionError('Connection refused'), requests.Timeout('Read timed out')])
+def test_network_errors_raised_as_tweep_errors(error):
+    api = TwAPI('token', 'token_secret', 'key', 'secret')
+    api.local.session = FailingSession(error)
+
+    with pytest.raises(tweepy.TweepError):
+        api.get_status('1')